@@ -403,9 +403,18 @@ with tab2:
                 
                 # --- CONNECT TO OPTIMIZER ---
                 if items_data:
+                    # Anytime search: fixed time budget, live status of the best plan so far
+                    progress_text = st.empty()
+                    def show_progress(best_plan, progress):
+                        progress_text.caption(
+                            f"⏱️ {progress['elapsed_s']:.1f}s | Simulations: {progress['completed']}/{progress['total']} | "
+                            f"Best so far: {progress['unpacked_count']} unpacked, {progress['balance_ratio_len']:.0f}% nose"
+                        )
+                    
                     container = optimizer.solve_packing(
                         container_l=cont_l, container_w=cont_w, container_h=cont_h, 
-                        items_data=items_data, allow_stacking=enable_stacking_flag, min_gap=min_gap_val
+                        items_data=items_data, allow_stacking=enable_stacking_flag, min_gap=min_gap_val,
+                        n_simulations=50, time_budget_s=10, on_progress=show_progress
                     )
                     st.session_state['container_plan'] = container
                 else:
@@ -468,9 +477,9 @@ with tab2:
                         
                         def update_hud_prop(item, axis, key):
                             val = st.session_state[key]
-                            if axis == 'x': item.x = val
-                            elif axis == 'y': item.y = val
-                            elif axis == 'z': item.z = val
+                            if axis == 'x': container_res.move_item(item, x=val)
+                            elif axis == 'y': container_res.move_item(item, y=val)
+                            elif axis == 'z': container_res.move_item(item, z=val)
                         
                         # --- X, Y, Z CONTROLS WITH SAFE BOUNDARIES ---
                         st.markdown('<div class="hud-label">Position</div>', unsafe_allow_html=True)
@@ -498,6 +507,7 @@ with tab2:
                                     dims = item_to_edit.get_dimension()
                                     if item_to_edit.x + dims[0] > container_res.L: item_to_edit.x = container_res.L - dims[0]
                                     if item_to_edit.y + dims[1] > container_res.W: item_to_edit.y = container_res.W - dims[1]
+                                    container_res.move_item(item_to_edit)
                                     st.rerun()
                             with c_btn2:
                                 if st.button("⬇️ Auto Drop", key=f"drop_{idx}", type="primary", use_container_width=True):
@@ -523,12 +533,11 @@ with tab2:
                                     dims = item_to_edit.get_dimension()
                                     if item_to_edit.x + dims[0] > container_res.L: item_to_edit.x = container_res.L - dims[0]
                                     if item_to_edit.y + dims[1] > container_res.W: item_to_edit.y = container_res.W - dims[1]
+                                    container_res.move_item(item_to_edit)
                                     st.rerun()
                             with c_btn2:
                                 if st.button("📤 Unpack", key=f"unpack_{idx}", type="primary", use_container_width=True):
-                                    moved_item = container_res.items.pop(idx)
-                                    container_res.unpacked_items.append(moved_item)
-                                    container_res.current_weight -= moved_item.weight
+                                    moved_item = container_res.unpack_item(idx)
                                     st.session_state["manual_select"] = f"U_{len(container_res.unpacked_items)-1} | {moved_item.name}"
                                     st.session_state["last_table_sel"] = []
                                     st.session_state["last_chart_sel"] = []
@@ -557,11 +566,12 @@ with tab2:
             delta_color = "normal" if 45 <= bal <= 55 else "inverse"
             kpi4.metric("Long. Bal", f"{bal:.0f}%", delta="Target 50%", delta_color=delta_color)
 
-            # 3D Chart
-            try:
-                fig = optimizer.visualize_container(container, highlight_name=highlight_name)
-            except TypeError:
-                fig = optimizer.visualize_container(container)
+            # Plan validator (collisions, support, stacking, loads): once per rerun, shared by chart and table
+            plan_status = optimizer.validate_plan(container)['status']
+            
+            # 3D Chart (cached between reruns: HUD nudges only patch the moved boxes)
+            if 'fig_cache' not in st.session_state: st.session_state['fig_cache'] = optimizer.FigureCache()
+            fig = st.session_state['fig_cache'].figure(container, highlight_name=highlight_name, status=plan_status)
             
             fig.update_layout(clickmode='event+select', hovermode='closest')
             event = st.plotly_chart(fig, use_container_width=True, theme="streamlit", on_select="rerun", selection_mode="points", key="3d_chart_v2")
@@ -598,10 +608,10 @@ with tab2:
             st.caption("📋 **Click a row below to select item:**")
             list_data = []
             
-            # Add Packed Items
+            # Add Packed Items (status from the plan validator above)
             for i, item in enumerate(container.items):
                 list_data.append({
-                    "Ref": f"P_{i}", "Status": "✅ Inside", "Name": item.name, 
+                    "Ref": f"P_{i}", "Status": optimizer.PLAN_STATUS_TEXT[plan_status[i]], "Name": item.name, 
                     "Dim": f"{item.l:.0f}x{item.w:.0f}x{item.h:.0f}", 
                     "Pos": f"({getattr(item, 'x', 0):.0f}, {getattr(item, 'y', 0):.0f}, {getattr(item, 'z', 0):.0f})"
                 })
@@ -0,0 +1,203 @@
+import random
+import time
+
+import optimizer
+
+# --- MICRO BENCHMARKS FOR THE OPTIMIZER HOT LOOPS ---
+# Run with: python benchmark.py
+
+CONT_L, CONT_W, CONT_H = 12030, 2350, 2390
+
+
+def build_filled_container(n_items, box=(300, 290, 290), n_types=1):
+    """Places n_items boxes in a regular floor/stack pattern (no solver involved)."""
+    container = optimizer.Container(CONT_L, CONT_W, CONT_H, max_weight=10**9)
+    l, w, h = box
+    per_row = int(CONT_W // w)
+    per_layer = per_row * int(CONT_L // l)
+    for n in range(n_items):
+        layer, rest = divmod(n, per_layer)
+        col, row = divmod(rest, per_row)
+        item = optimizer.Item(f"Box_{n}", l, w, h, 10, max_load_on_top=1000,
+                              type_id=f"T{n % n_types}", packaging_type=1 + n % 2)
+        container.place_item(item, 0, col * l, row * w, layer * h)
+    return container
+
+
+def linear_collides(container, x, y, z, l, w, h):
+    eps = optimizer.EPSILON
+    for other in container.items:
+        o_l, o_w, o_h = other.get_dimension()
+        if (x < other.x + o_l - eps and x + l > other.x + eps and
+            y < other.y + o_w - eps and y + w > other.y + eps and
+            z < other.z + o_h - eps and z + h > other.z + eps):
+            return True
+    return False
+
+
+def grid_collides(container, x, y, z, l, w, h):
+    eps = optimizer.EPSILON
+    for other in container.grid.query(x, y, l, w):
+        o_l, o_w, o_h = other.get_dimension()
+        if (x < other.x + o_l - eps and x + l > other.x + eps and
+            y < other.y + o_w - eps and y + w > other.y + eps and
+            z < other.z + o_h - eps and z + h > other.z + eps):
+            return True
+    return False
+
+
+def bench_collision(sizes=(50, 100, 200, 400, 800), n_queries=5000, seed=7):
+    print("--- COLLISION QUERIES: linear scan vs spatial grid ---")
+    print(f"{'items':>6} {'linear (s)':>11} {'grid (s)':>9} {'speed-up':>9}")
+    for n in sizes:
+        container = build_filled_container(n)
+        rd = random.Random(seed)
+        queries = [(rd.uniform(0, CONT_L - 500), rd.uniform(0, CONT_W - 500), rd.uniform(0, CONT_H - 500), 500, 500, 500)
+                   for _ in range(n_queries)]
+
+        t0 = time.perf_counter()
+        res_linear = [linear_collides(container, *q) for q in queries]
+        t_linear = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        res_grid = [grid_collides(container, *q) for q in queries]
+        t_grid = time.perf_counter() - t0
+
+        assert res_linear == res_grid, "Spatial grid disagrees with the linear scan!"
+        print(f"{n:>6} {t_linear:>11.3f} {t_grid:>9.3f} {t_linear / t_grid:>8.1f}x")
+
+
+def scan_balanced_bonuses(container, item, x, y, z):
+    """Reference: the original per-anchor loops over container.items."""
+    eps = optimizer.EPSILON
+    item_l, item_w, item_h = item.get_dimension()
+    grouping_bonus, type_bonus, adjacency_bonus = 0, 0, 0
+    for other in container.items:
+        dist = abs(other.x - x) + abs(other.y - y) + abs(other.z - z)
+        if dist < max(item_l, item_w, item_h) * 2:
+            if other.type_id == item.type_id: type_bonus += 20
+            if other.packaging_type == item.packaging_type: grouping_bonus += 10
+    for other in container.items:
+        if (abs(x - (other.x + other.get_dimension()[0])) < eps or abs((x + item_l) - other.x) < eps or
+            abs(y - (other.y + other.get_dimension()[1])) < eps or abs((y + item_w) - other.y) < eps) and \
+            abs(z - other.z) < other.get_dimension()[2]:
+            adjacency_bonus += 30
+            break
+    return type_bonus, grouping_bonus, adjacency_bonus
+
+
+def index_balanced_bonuses(container, item, x, y, z):
+    item_l, item_w, item_h = item.get_dimension()
+    type_bonus, grouping_bonus = container.neighbours.grouping_bonus(item, x, y, z, max(item_l, item_w, item_h) * 2)
+    adjacency_bonus = 30 if container.neighbours.touches(x, y, z, item_l, item_w) else 0
+    return type_bonus, grouping_bonus, adjacency_bonus
+
+
+def bench_neighbours(sizes=(50, 100, 200, 400, 800), n_queries=2000, seed=11):
+    print("--- BALANCED BONUSES: linear scan vs neighbour index ---")
+    print(f"{'items':>6} {'linear (s)':>11} {'index (s)':>10} {'speed-up':>9}")
+    for n in sizes:
+        container = build_filled_container(n, n_types=3)
+        probe = optimizer.Item("Probe", 300, 290, 290, 10, type_id="T1", packaging_type=2)
+        rd = random.Random(seed)
+        # Half the probes sit exactly on the box lattice so touch/threshold edges get exercised
+        queries = []
+        for q in range(n_queries):
+            if q % 2:
+                queries.append((rd.randint(0, 39) * 300.0, rd.randint(0, 7) * 290.0, rd.randint(0, 7) * 290.0))
+            else:
+                queries.append((rd.uniform(0, CONT_L), rd.uniform(0, CONT_W), rd.uniform(0, CONT_H)))
+
+        t0 = time.perf_counter()
+        res_linear = [scan_balanced_bonuses(container, probe, *q) for q in queries]
+        t_linear = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        res_index = [index_balanced_bonuses(container, probe, *q) for q in queries]
+        t_index = time.perf_counter() - t0
+
+        assert res_linear == res_index, "Neighbour index disagrees with the linear scan!"
+        print(f"{n:>6} {t_linear:>11.3f} {t_index:>10.3f} {t_linear / t_index:>8.1f}x")
+
+
+def bench_move_table(n_steps=60, seed=19):
+    print("--- INCREMENTAL ANCHOR SEARCH: full scan vs best-move table ---")
+    print(f"{'strategy':>9} {'full (s)':>9} {'table (s)':>10} {'speed-up':>9}")
+    for strategy in ('balanced', 'density'):
+        container = optimizer.Container(CONT_L, CONT_W, CONT_H, max_weight=10**9)
+        table = optimizer.BestMoveTable(container)
+        rd = random.Random(seed)
+        probes = [optimizer.Item(f"Probe_{t}", rd.choice([600, 800, 1200]), rd.choice([400, 600, 800]),
+                                 rd.choice([300, 500, 700]), rd.choice([50, 100]), max_load_on_top=1000,
+                                 type_id=f"T{t}", packaging_type=1 + t % 2) for t in range(4)]
+        t_full = t_table = 0.0
+        for _ in range(n_steps):
+            # Every probe and rotation is checked after each placement, then one of them is placed
+            moves = []
+            for probe in probes:
+                for rot in (0, 1):
+                    probe.rotation = rot
+                    t0 = time.perf_counter()
+                    anchors = container.get_all_valid_anchors(probe, scoring_strategy=strategy)
+                    t_full += time.perf_counter() - t0
+                    t0 = time.perf_counter()
+                    best = table.best_anchor(probe, scoring_strategy=strategy)
+                    t_table += time.perf_counter() - t0
+                    expected = anchors[0] if anchors else None
+                    assert best == expected, "Best-move table disagrees with the full anchor scan!"
+                    if best: moves.append((probe, rot, best))
+            if not moves: break
+            probe, rot, best = rd.choice(moves)
+            item = optimizer.Item(f"{probe.name}_{len(container.items)}", probe.l, probe.w, probe.h, probe.weight,
+                                  max_load_on_top=probe.max_load_on_top, type_id=probe.type_id,
+                                  packaging_type=probe.packaging_type)
+            container.place_item(item, rot, *best[1], best[3])
+        print(f"{strategy:>9} {t_full:>9.3f} {t_table:>10.3f} {t_full / t_table:>8.1f}x")
+
+
+def bench_solver(quantities=(25, 50, 100, 200), seed=3):
+    print("--- FULL SOLVE (40ft, mixed pallets/crates) ---")
+    print(f"{'pieces':>6} {'time (s)':>9} {'packed':>7}")
+    for qty in quantities:
+        rd = random.Random(seed)
+        items = [{'name': f"Line_{t}", 'l': rd.choice([600, 800, 1000, 1200]), 'w': rd.choice([400, 600, 800]),
+                  'h': rd.choice([300, 500, 700]), 'weight': rd.choice([50, 100, 200]),
+                  'qty': qty // 4, 'packaging_type': 1 + t % 2} for t in range(4)]
+        # The two baseline strategy runs on one core, comparable across versions (no multi-start)
+        t0 = time.perf_counter()
+        container = optimizer.solve_packing(CONT_L, CONT_W, CONT_H, items, n_simulations=2, max_workers=1)
+        elapsed = time.perf_counter() - t0
+        print(f"{qty:>6} {elapsed:>9.2f} {len(container.items):>7}")
+
+
+
+def bench_multistart(n_manifests=6, n_simulations=50, seed=23):
+    print("--- MULTI-START SOLVE (defaults) vs baseline two-strategy run ---")
+    print(f"{'manifest':>8} {'cont':>5} {'base (s)':>9} {'multi (s)':>10} {'unpacked':>9}")
+    no_limits = float('inf')
+    for m in range(n_manifests):
+        rd = random.Random(seed + m)
+        items = [{'name': f"Line_{t}", 'l': rd.choice([800, 1000, 1200, 1500]), 'w': rd.choice([600, 800, 1000, 1150]),
+                  'h': rd.choice([500, 800, 1100]), 'weight': rd.choice([150, 300, 600, 900]),
+                  'qty': rd.randint(3, 10), 'packaging_type': 1 + t % 2} for t in range(4)]
+        for cont_l in (5900, CONT_L):
+            # Baseline: the two unperturbed strategy runs, picked by score alone (no weight limits)
+            t0 = time.perf_counter()
+            base = optimizer.solve_packing(cont_l, CONT_W, CONT_H, items, n_simulations=2, max_workers=1,
+                                           max_lr_diff=no_limits, max_fb_diff=no_limits)
+            t_base = time.perf_counter() - t0
+            t0 = time.perf_counter()
+            multi = optimizer.solve_packing(cont_l, CONT_W, CONT_H, items, n_simulations=n_simulations)
+            t_multi = time.perf_counter() - t0
+            assert len(multi.unpacked_items) <= len(base.unpacked_items), \
+                "Multi-start search left more cargo behind than the baseline run!"
+            print(f"{m:>8} {cont_l:>5} {t_base:>9.2f} {t_multi:>10.2f} "
+                  f"{len(multi.unpacked_items):>4}/{len(base.unpacked_items):<4}")
+
+
+if __name__ == "__main__":
+    bench_collision()
+    bench_neighbours()
+    bench_move_table()
+    bench_solver()
+    bench_multistart()
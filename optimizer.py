@@ -1,12 +1,26 @@
 import plotly.graph_objects as go
 import random
 import copy
+import os
+import pickle
+import time
+import math
+import concurrent.futures
+
+try:
+    import numpy as np # Optional: vectorised anchor checks (backend='numpy')
+except ImportError:
+    np = None
 
 # Tolerance for floating point comparisons to prevent microscopic misfits
 # Increased to 1.0mm to handle real-world data imperfections/rounding errors
 EPSILON = 1.0
 
-class Item:
+class ItemType:
+    """
+    Static description shared by every unit of one packing-list line:
+    dimensions, weight, packaging, stacking limits and display colour.
+    """
     def __init__(self, name, length, width, height, weight, 
                  color=None,
                  priority=1,        # 1=Most Inside (First loaded), higher numbers=Closer to door
@@ -28,8 +42,6 @@ class Item:
         self.max_load_on_top = float(max_load_on_top)
         self.allow_stacking = allow_stacking
         self.packaging_type = int(packaging_type)
-        self.current_load_on_top = 0.0
-        self.stack_layer = 1 # Tracks vertical position (1=Ground, 2=First Stack, etc.)
         
         # Derived props
         self.vol = self.l * self.w * self.h
@@ -58,22 +70,653 @@ class Item:
             
         self.color = f'rgb({r}, {g}, {b})'
         
+        # Everything the anchor search looks at: units with equal keys are interchangeable
+        self.key = (self.l, self.w, self.h, self.weight, self.packaging_type, self.type_id,
+                    self.priority, self.max_load_on_top, self.allow_stacking)
+
+def _spec_property(name):
+    return property(lambda self: getattr(self.spec, name), doc=f"ItemType.{name} (shared, read-only)")
+
+class Item:
+    """
+    One physical unit: a shared ItemType plus its own placement state.
+    Static attributes (name, l, w, h, weight, color, ...) read through to the type,
+    so large quantities share one description instead of one copy per unit.
+    """
+    __slots__ = ('spec', 'x', 'y', 'z', 'rotation', 'stack_layer', 'current_load_on_top')
+
+    name = _spec_property('name')
+    l = _spec_property('l')
+    w = _spec_property('w')
+    h = _spec_property('h')
+    weight = _spec_property('weight')
+    priority = _spec_property('priority')
+    type_id = _spec_property('type_id')
+    max_load_on_top = _spec_property('max_load_on_top')
+    allow_stacking = _spec_property('allow_stacking')
+    packaging_type = _spec_property('packaging_type')
+    vol = _spec_property('vol')
+    base_area = _spec_property('base_area')
+    color = _spec_property('color')
+
+    def __init__(self, name, length, width, height, weight, 
+                 color=None,
+                 priority=1,        # 1=Most Inside (First loaded), higher numbers=Closer to door
+                 type_id=None,      # Group ID for clustering
+                 max_load_on_top=0.0, 
+                 allow_stacking=True,
+                 packaging_type=1): # 1: Pallet, 2: Crate
+        self.spec = ItemType(name, length, width, height, weight, color=color, priority=priority,
+                             type_id=type_id, max_load_on_top=max_load_on_top,
+                             allow_stacking=allow_stacking, packaging_type=packaging_type)
+        self.reset_placement()
+
+    @classmethod
+    def from_type(cls, item_type):
+        """New unit of an existing ItemType (no per-unit copy of the static props)."""
+        item = cls.__new__(cls)
+        item.spec = item_type
+        item.reset_placement()
+        return item
+
+    def reset_placement(self):
+        """Back to the unplaced state (solver runs reuse the same Item objects)."""
         self.x = 0
         self.y = 0
         self.z = 0
         self.rotation = 0 # 0: original, 1: rotated 90 deg on floor
+        self.stack_layer = 1 # Tracks vertical position (1=Ground, 2=First Stack, etc.)
+        self.current_load_on_top = 0.0
+
+    def spec_key(self):
+        """Everything the anchor search looks at: items with equal keys are interchangeable."""
+        return self.spec.key
 
     def get_dimension(self):
         # STRICT ROTATION LOGIC:
         # Rotation 0: Original L, W
         # Rotation 1: Swapped W, L (Rotated 90 deg on floor)
         # Height (H) is NEVER swapped, ensuring "No Upside Down" constraint.
+        spec = self.spec
         if self.rotation == 1:
-            return self.w, self.l, self.h
-        return self.l, self.w, self.h
+            return spec.w, spec.l, spec.h
+        return spec.l, spec.w, spec.h
+
+class SpatialGrid:
+    """
+    Uniform floor grid (X-Y cells) holding the placed boxes.
+    Collision queries only look at the cells a footprint covers instead of
+    scanning every item in the container.
+    """
+    def __init__(self, cell_size=500.0):
+        self.cell_size = float(cell_size)
+        self.cells = {}
+        self._keys = {} # id(item) -> list of cell keys the item is registered in
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __contains__(self, item):
+        return id(item) in self._keys
+
+    def _cell_keys(self, x, y, l, w):
+        cs = self.cell_size
+        ix0 = int((x - EPSILON) // cs)
+        ix1 = int((x + l + EPSILON) // cs)
+        iy0 = int((y - EPSILON) // cs)
+        iy1 = int((y + w + EPSILON) // cs)
+        return [(ix, iy) for ix in range(ix0, ix1 + 1) for iy in range(iy0, iy1 + 1)]
+
+    def insert(self, item):
+        l, w, _ = item.get_dimension()
+        keys = self._cell_keys(item.x, item.y, l, w)
+        for key in keys:
+            self.cells.setdefault(key, []).append(item)
+        self._keys[id(item)] = keys
+
+    def remove(self, item):
+        keys = self._keys.pop(id(item), None)
+        if keys is None: return
+        for key in keys:
+            bucket = self.cells.get(key)
+            if bucket is None: continue
+            bucket[:] = [other for other in bucket if other is not item]
+            if not bucket: del self.cells[key]
+
+    def update(self, item):
+        self.remove(item)
+        self.insert(item)
+
+    def clear(self):
+        self.cells = {}
+        self._keys = {}
+
+    def query(self, x, y, l, w):
+        """Returns the placed items whose footprint cells touch the given footprint."""
+        found = {}
+        for key in self._cell_keys(x, y, l, w):
+            for other in self.cells.get(key, ()):
+                found[id(other)] = other
+        return list(found.values())
+
+class ExtremePointSet:
+    """
+    Multiset of the face coordinates of placed boxes (x/x+l, y/y+w, top z).
+    Maintained once per placement so anchor generation does not have to walk
+    every placed item for each item/rotation it is asked about.
+    """
+    def __init__(self):
+        self.xs = {} # coordinate -> number of boxes contributing it
+        self.ys = {}
+        self.zs = {} # top faces of stackable boxes only
+        self._registered = {} # id(item) -> (x values, y values, z values)
+
+    def __len__(self):
+        return len(self._registered)
+
+    @staticmethod
+    def _bump(counts, values, step):
+        """Applies the count change and returns the values that were not present before."""
+        created = []
+        for v in values:
+            n = counts.get(v, 0) + step
+            if n == 1 and step > 0: created.append(v)
+            if n > 0: counts[v] = n
+            else: counts.pop(v, None)
+        return created
+
+    def add(self, item):
+        """Registers the item's faces. Returns the (x, y, z) coordinates it introduced."""
+        p_l, p_w, p_h = item.get_dimension()
+        entry = ((item.x, item.x + p_l), (item.y, item.y + p_w),
+                 (item.z + p_h,) if item.allow_stacking else ())
+        created = (self._bump(self.xs, entry[0], 1),
+                   self._bump(self.ys, entry[1], 1),
+                   self._bump(self.zs, entry[2], 1))
+        self._registered[id(item)] = entry
+        return created
+
+    def remove(self, item):
+        entry = self._registered.pop(id(item), None)
+        if entry is None: return
+        self._bump(self.xs, entry[0], -1)
+        self._bump(self.ys, entry[1], -1)
+        self._bump(self.zs, entry[2], -1)
+
+    def clear(self):
+        self.xs, self.ys, self.zs = {}, {}, {}
+        self._registered = {}
+
+class SupportSurfaceIndex:
+    """
+    Top faces of placed boxes grouped by their top-z level.
+    Stacking anchors look up the boxes ending at their z directly instead of
+    scanning every placed item. Boxes keep their placement order (seq) so the
+    first valid support found is the same one a scan of container.items finds.
+    """
+    def __init__(self):
+        self.levels = {} # top z -> list of (seq, item, footprint)
+        self._level_of = {} # id(item) -> top z it is registered under
+
+    def add(self, item, seq):
+        p_l, p_w, p_h = item.get_dimension()
+        top_z = item.z + p_h
+        footprint = (item.x, item.x + p_l, item.y, item.y + p_w)
+        self.levels.setdefault(top_z, []).append((seq, item, footprint))
+        self._level_of[id(item)] = top_z
+
+    def remove(self, item):
+        top_z = self._level_of.pop(id(item), None)
+        if top_z is None: return None
+        bucket = self.levels[top_z]
+        for pos, (seq, other, _) in enumerate(bucket):
+            if other is item:
+                del bucket[pos]
+                break
+        if not bucket: del self.levels[top_z]
+        return seq
+
+    def clear(self):
+        self.levels = {}
+        self._level_of = {}
+
+    def at_level(self, z):
+        """(item, (x0, x1, y0, y1)) for boxes whose top face is within EPSILON of z, in placement order."""
+        matches = []
+        for top_z, bucket in self.levels.items():
+            if abs(top_z - z) < EPSILON:
+                matches.extend(bucket)
+        if len(matches) > 1:
+            matches.sort(key=lambda entry: entry[0])
+        return [(other, footprint) for _, other, footprint in matches]
+
+class NeighbourIndex:
+    """
+    Proximity structure for the 'balanced' scoring bonuses.
+    - Anchor corners (x, y, z) of placed boxes are bucketed in coarse 3D cells
+      holding per-type and per-packaging counts. Cells completely inside the
+      grouping radius contribute their counts directly, only boundary cells
+      are checked item by item.
+    - Face coordinates (x, x+l, y, y+w) are bucketed per millimetre so the
+      touch test only looks at boxes sharing a face with the anchor.
+    """
+    def __init__(self, cell_size=1000.0):
+        self.cell_size = float(cell_size)
+        self.cells = {} # (ix, iy, iz) -> [items, type counts, packaging counts]
+        self.faces = ({}, {}, {}, {}) # x+l, x, y+w, y -> {bucket: [items]}
+        self._registered = {} # id(item) -> (cell key, face buckets)
+
+    def _face_values(self, item):
+        p_l, p_w, _ = item.get_dimension()
+        return (item.x + p_l, item.x, item.y + p_w, item.y)
+
+    def add(self, item):
+        cs = self.cell_size
+        key = (int(item.x // cs), int(item.y // cs), int(item.z // cs))
+        cell = self.cells.get(key)
+        if cell is None:
+            cell = self.cells[key] = [[], {}, {}]
+        cell[0].append(item)
+        cell[1][item.type_id] = cell[1].get(item.type_id, 0) + 1
+        cell[2][item.packaging_type] = cell[2].get(item.packaging_type, 0) + 1
+        
+        buckets = []
+        for faces, v in zip(self.faces, self._face_values(item)):
+            b = int(v // EPSILON)
+            faces.setdefault(b, []).append(item)
+            buckets.append(b)
+        self._registered[id(item)] = (key, buckets)
+
+    def remove(self, item):
+        entry = self._registered.pop(id(item), None)
+        if entry is None: return
+        key, buckets = entry
+        cell = self.cells[key]
+        cell[0][:] = [other for other in cell[0] if other is not item]
+        for counts, k in ((cell[1], item.type_id), (cell[2], item.packaging_type)):
+            counts[k] -= 1
+            if counts[k] == 0: del counts[k]
+        if not cell[0]: del self.cells[key]
+        for faces, b in zip(self.faces, buckets):
+            faces[b][:] = [other for other in faces[b] if other is not item]
+            if not faces[b]: del faces[b]
+
+    def clear(self):
+        self.cells = {}
+        self.faces = ({}, {}, {}, {})
+        self._registered = {}
+
+    def grouping_bonus(self, item, x, y, z, threshold):
+        """(type_bonus, grouping_bonus): boxes whose corner lies within L1 distance < threshold."""
+        cs = self.cell_size
+        type_hits, pack_hits = 0, 0
+        for (ix, iy, iz), (members, type_counts, pack_counts) in self.cells.items():
+            near, far = 0.0, 0.0
+            for lo, q in ((ix * cs, x), (iy * cs, y), (iz * cs, z)):
+                d_lo, d_hi = lo - q, lo + cs - q
+                if d_lo > 0: near += d_lo
+                elif d_hi < 0: near -= d_hi
+                far += max(abs(d_lo), abs(d_hi))
+            # Small margin keeps the shortcut exact under float rounding
+            if near >= threshold + 1e-6:
+                continue
+            if far < threshold - 1e-6:
+                type_hits += type_counts.get(item.type_id, 0)
+                pack_hits += pack_counts.get(item.packaging_type, 0)
+                continue
+            for other in members:
+                if abs(other.x - x) + abs(other.y - y) + abs(other.z - z) < threshold:
+                    if other.type_id == item.type_id: type_hits += 1
+                    if other.packaging_type == item.packaging_type: pack_hits += 1
+        return type_hits * 20, pack_hits * 10
+
+    def touches(self, x, y, z, item_l, item_w):
+        """True if any box has a face on the anchor's faces and overlaps its z start."""
+        for faces, v in zip(self.faces, (x, x + item_l, y, y + item_w)):
+            b = int(v // EPSILON)
+            for bucket in (b - 1, b, b + 1):
+                for other in faces.get(bucket, ()):
+                    if abs(other.z - z) >= other.get_dimension()[2]: continue
+                    if any(abs(f - w) < EPSILON for f, w in zip(self._face_values(other), (x, x + item_l, y, y + item_w))):
+                        return True
+        return False
+
+class BoxArray:
+    """Placed boxes as an (N, 6) float array of [x0, y0, z0, x1, y1, z1] rows for batched NumPy tests."""
+    def __init__(self):
+        self.data = np.empty((64, 6), dtype=float)
+        self.n = 0
+        self.items = []
+        self._row = {} # id(item) -> row index
+
+    def __len__(self):
+        return self.n
+
+    def add(self, item):
+        if self.n == len(self.data):
+            self.data = np.concatenate([self.data, np.empty_like(self.data)])
+        p_l, p_w, p_h = item.get_dimension()
+        self.data[self.n] = (item.x, item.y, item.z, item.x + p_l, item.y + p_w, item.z + p_h)
+        self.items.append(item)
+        self._row[id(item)] = self.n
+        self.n += 1
+
+    def remove(self, item):
+        row = self._row.pop(id(item), None)
+        if row is None: return
+        # Swap-delete: row order does not matter for overlap tests
+        last = self.n - 1
+        if row != last:
+            self.data[row] = self.data[last]
+            self.items[row] = self.items[last]
+            self._row[id(self.items[row])] = row
+        self.items.pop()
+        self.n = last
+
+    def clear(self):
+        self.n = 0
+        self.items = []
+        self._row = {}
+
+    def view(self):
+        return self.data[:self.n]
+
+class WeightMoments:
+    """
+    Running weight totals of the packed boxes: total weight and volume, first moments
+    along x/y/z and the nose/door, left/right and bottom/top sums around the
+    container mid planes. Each box's contribution is remembered so it can be taken
+    back even after its pose was edited in place.
+    """
+    # Slots of a contribution / of self.sums
+    FIELDS = ('weight', 'vol', 'moment_x', 'moment_y', 'moment_z',
+              'nose', 'nose_tie', 'door', 'left', 'left_tie', 'right', 'bottom', 'top')
+
+    def __init__(self, length, width, height):
+        self.mid = (length / 2, width / 2, height / 2)
+        self.clear()
+
+    def _contribution(self, item):
+        mid_L, mid_W, mid_H = self.mid
+        l, w, h = item.get_dimension()
+        wt = item.weight
+        cx, cy, cz = item.x + l / 2, item.y + w / 2, item.z + h / 2
+        return (wt, item.vol, cx * wt, cy * wt, cz * wt,
+                wt if cx < mid_L else 0.0, wt if cx == mid_L else 0.0, 0.0 if cx < mid_L else wt,
+                wt if cy < mid_W else 0.0, wt if cy == mid_W else 0.0, 0.0 if cy < mid_W else wt,
+                wt if cz < mid_H else 0.0, 0.0 if cz < mid_H else wt)
+
+    def add(self, item):
+        part = self._contribution(item)
+        self._parts[id(item)] = part
+        self.sums = [a + b for a, b in zip(self.sums, part)]
+
+    def remove(self, item):
+        part = self._parts.pop(id(item), None)
+        if part is None: return
+        if not self._parts:
+            # Start from exact zeros again instead of carrying float residue
+            self.sums = [0.0] * len(self.FIELDS)
+        else:
+            self.sums = [a - b for a, b in zip(self.sums, part)]
+
+    def clear(self):
+        self.sums = [0.0] * len(self.FIELDS)
+        self._parts = {}
+
+    def __getitem__(self, field):
+        return self.sums[self.FIELDS.index(field)]
+
+    def left_ratio_if(self, item, y):
+        """Left weight ratio (%) if item were added with its left side at y (ties count as right)."""
+        total = self['weight'] + item.weight
+        if total <= 0: return 50.0
+        left = self['left']
+        if y + item.get_dimension()[1] / 2 < self.mid[1]: left += item.weight
+        return left / total * 100
+
+class HeightMap:
+    """
+    2.5D floor model: top z and top box of every cell_size x cell_size floor cell.
+    Cells are only claimed by boxes overlapping them by more than eps, but a box
+    edge off the cell grid still claims the shared edge cell, so region queries return
+    candidates that callers confirm exactly (see Container.drop_height).
+    Uses NumPy arrays when available, nested lists otherwise.
+    """
+    def __init__(self, length, width, cell_size=10.0, eps=EPSILON):
+        self.cell_size = cell_size
+        self.eps = eps
+        self.nx = max(1, int(-(-length // cell_size)))
+        self.ny = max(1, int(-(-width // cell_size)))
+        self.clear()
+
+    def clear(self):
+        if np is not None:
+            self.tops = np.zeros((self.nx, self.ny))
+            self.ids = np.zeros((self.nx, self.ny), dtype=np.int64) # 0 = bare floor
+        else:
+            self.tops = [[0.0] * self.ny for _ in range(self.nx)]
+            self.ids = [[0] * self.ny for _ in range(self.nx)]
+        self.items = {} # id(item) -> item
+        self._footprints = {} # id(item) -> cell ranges it was stamped on
+
+    def _cells(self, x, y, l, w):
+        """Cell index ranges [i0, i1) x [j0, j1) overlapped by a footprint."""
+        cs, eps = self.cell_size, self.eps
+        i0 = max(0, int((x + eps) // cs))
+        i1 = min(self.nx, int(-(-(x + l - eps) // cs)))
+        j0 = max(0, int((y + eps) // cs))
+        j1 = min(self.ny, int(-(-(y + w - eps) // cs)))
+        return i0, i1, j0, j1
+
+    def _stamp(self, item, clip=None):
+        l, w, h = item.get_dimension()
+        i0, i1, j0, j1 = self._cells(item.x, item.y, l, w)
+        if clip is not None:
+            i0, i1, j0, j1 = max(i0, clip[0]), min(i1, clip[1]), max(j0, clip[2]), min(j1, clip[3])
+        if i0 >= i1 or j0 >= j1: return
+        top, key = item.z + h, id(item)
+        if np is not None:
+            tops, ids = self.tops[i0:i1, j0:j1], self.ids[i0:i1, j0:j1]
+            higher = tops <= top
+            tops[higher] = top
+            ids[higher] = key
+            return
+        for i in range(i0, i1):
+            row_tops, row_ids = self.tops[i], self.ids[i]
+            for j in range(j0, j1):
+                if row_tops[j] <= top:
+                    row_tops[j] = top
+                    row_ids[j] = key
+
+    def add(self, item):
+        l, w, _ = item.get_dimension()
+        self.items[id(item)] = item
+        self._footprints[id(item)] = self._cells(item.x, item.y, l, w)
+        self._stamp(item)
+
+    def remove(self, item, grid):
+        """Unstamps the item and restamps what is left under its footprint (grid: the boxes still packed)."""
+        if self.items.pop(id(item), None) is None: return
+        # The stamped footprint, not the current pose: move_item edits the pose first
+        clip = self._footprints.pop(id(item))
+        i0, i1, j0, j1 = clip
+        if np is not None:
+            self.tops[i0:i1, j0:j1] = 0.0
+            self.ids[i0:i1, j0:j1] = 0
+        else:
+            for i in range(i0, i1):
+                self.tops[i][j0:j1] = [0.0] * (j1 - j0)
+                self.ids[i][j0:j1] = [0] * (j1 - j0)
+        cs = self.cell_size
+        for other in grid.query(i0 * cs, j0 * cs, (i1 - i0) * cs, (j1 - j0) * cs):
+            if other is not item: self._stamp(other, clip)
+
+    def region(self, x, y, l, w):
+        """(highest top, {top boxes}) over the cells under a footprint."""
+        i0, i1, j0, j1 = self._cells(x, y, l, w)
+        if i0 >= i1 or j0 >= j1: return 0.0, set()
+        if np is not None:
+            tops = self.tops[i0:i1, j0:j1]
+            keys = np.unique(self.ids[i0:i1, j0:j1]).tolist()
+            return float(tops.max()), {self.items[k] for k in keys if k}
+        highest, found = 0.0, set()
+        for i in range(i0, i1):
+            highest = max(highest, max(self.tops[i][j0:j1]))
+            found.update(self.ids[i][j0:j1])
+        return highest, {self.items[k] for k in found if k}
+
+class SupportGraph:
+    """
+    Which boxes rest on which: a DAG of resting contacts with their contact areas.
+    It owns item.current_load_on_top (the weight resting directly on a box, every box
+    above split over its supports by contact area) and item.stack_layer (1 + highest
+    layer underneath), and keeps both up to date on add/remove in O(stack depth).
+    max_load_on_top is a direct-load limit, as in can_support and validate_plan: the
+    weight of the boxes further up is not carried down the column.
+    """
+    def __init__(self, eps=EPSILON):
+        self.eps = eps
+        self.clear()
+
+    def clear(self):
+        self.below = {} # id(item) -> [(support, contact area)]
+        self.above = {} # id(item) -> [boxes resting on it]
+        self.items = {}
+
+    def _fractions(self, item):
+        below = self.below[id(item)]
+        if len(below) == 1: return [(below[0][0], 1.0)]
+        total = sum(area for _, area in below)
+        return [(support, area / total) for support, area in below]
+
+    def _shares(self, item):
+        # Exact weight for a single support, so solver loads stay plain sums
+        below = self.below[id(item)]
+        if len(below) == 1: return [(below[0][0], item.weight)]
+        return [(support, item.weight * f) for support, f in self._fractions(item)]
+
+    def _apply_shares(self, item, sign):
+        for support, share in self._shares(item):
+            support.current_load_on_top += sign * share
+            if not self.above.get(id(support)):
+                # Nothing left on top: drop the float residue
+                support.current_load_on_top = 0.0
+
+    def _relayer(self, start):
+        queue = list(start)
+        while queue:
+            item = queue.pop()
+            below = self.below[id(item)]
+            layer = 1 + max(support.stack_layer for support, _ in below) if below else 1
+            if layer != item.stack_layer:
+                item.stack_layer = layer
+                queue.extend(self.above[id(item)])
+
+    def add(self, item, grid):
+        """Links the item to the packed boxes it rests on and that rest on it (grid: packed boxes)."""
+        l, w, h = item.get_dimension()
+        below, above = [], []
+        for other in grid.query(item.x, item.y, l, w):
+            if other is item or id(other) not in self.items: continue
+            o_l, o_w, o_h = other.get_dimension()
+            dx = min(item.x + l, other.x + o_l) - max(item.x, other.x)
+            dy = min(item.y + w, other.y + o_w) - max(item.y, other.y)
+            if dx <= self.eps or dy <= self.eps: continue
+            if abs(other.z + o_h - item.z) < self.eps: below.append((other, dx * dy))
+            elif abs(item.z + h - other.z) < self.eps: above.append((other, dx * dy))
+        
+        self.items[id(item)] = item
+        self.below[id(item)] = below
+        self.above[id(item)] = []
+        item.current_load_on_top = 0.0
+        for support, _ in below:
+            self.above[id(support)].append(item)
+        if below: self._apply_shares(item, 1)
+        
+        # Boxes already sitting on its top (manual placement underneath) now share it
+        for resting, area in above:
+            self._apply_shares(resting, -1)
+            self.below[id(resting)].append((item, area))
+            self.above[id(item)].append(resting)
+            self._apply_shares(resting, 1)
+        item.stack_layer = 0 # force _relayer to (re)assign and carry it upwards
+        self._relayer([item])
+
+    def remove(self, item):
+        if self.items.pop(id(item), None) is None: return
+        if self.below[id(item)]:
+            self._apply_shares(item, -1)
+        for support, _ in self.below.pop(id(item)):
+            self.above[id(support)].remove(item)
+            if not self.above[id(support)]: support.current_load_on_top = 0.0
+        resting_on = self.above.pop(id(item))
+        for resting in resting_on:
+            self._apply_shares(resting, -1)
+            self.below[id(resting)] = [(s, a) for s, a in self.below[id(resting)] if s is not item]
+            if self.below[id(resting)]: self._apply_shares(resting, 1)
+        item.current_load_on_top = 0.0
+        item.stack_layer = 1
+        self._relayer(resting_on)
+
+def stacking_compatible(below_type, below_rotation, above_type, above_rotation, eps=EPSILON):
+    """
+    can_support rules that only depend on the two item types and rotations:
+    packaging combinations, heavier-on-bottom and footprint overhang.
+    """
+    d_below = (below_type.w, below_type.l) if below_rotation == 1 else (below_type.l, below_type.w)
+    d_above = (above_type.w, above_type.l) if above_rotation == 1 else (above_type.l, above_type.w)
+
+    # --- PACKAGING TYPE & STACKING RULES ---
+
+    # Rule: Crate on Pallet: ❌ Forbidden
+    if below_type.packaging_type == 1 and above_type.packaging_type == 2:
+        return False 
+
+    # Rule: Pallet on Crate: ✅ Allowed ONLY if Pallet is strictly smaller
+    if below_type.packaging_type == 2 and above_type.packaging_type == 1:
+         if d_above[0] >= d_below[0] - eps or d_above[1] >= d_below[1] - eps:
+             return False
+    
+    # General Stability Rule (Pyramid): Heavier on Bottom
+    # MODIFIED: Allow 10% tolerance. E.g., 550kg can sit on 500kg.
+    # This improves Vertical Balance (Top Weight).
+    if above_type.weight > below_type.weight * 1.10:
+        return False
+
+    # --- END RULES ---
+
+    # 3. Dimension Scanning (Standard Overhang Check)
+    if d_above[0] > d_below[0] + eps or d_above[1] > d_below[1] + eps:
+        return False
+    
+    return True
+
+class StackingTable:
+    """
+    stacking_compatible() precomputed for every (type, rotation) pair of a manifest.
+    Built once per solve_packing; pairs it was not built for are computed on first use.
+    """
+    def __init__(self, item_types=(), eps=EPSILON):
+        self.eps = eps
+        self.allowed = {}
+        for below in item_types:
+            for above in item_types:
+                for below_rotation in (0, 1):
+                    for above_rotation in (0, 1):
+                        self.allowed[(below, below_rotation, above, above_rotation)] = \
+                            stacking_compatible(below, below_rotation, above, above_rotation, eps)
+
+    def allows(self, item_below, item_above):
+        key = (item_below.spec, item_below.rotation, item_above.spec, item_above.rotation)
+        allowed = self.allowed.get(key)
+        if allowed is None:
+            allowed = self.allowed[key] = stacking_compatible(*key, self.eps)
+        return allowed
 
 class Container:
-    def __init__(self, length, width, height, max_weight=28000, allow_stacking=True, min_gap=0.0):
+    def __init__(self, length, width, height, max_weight=28000, allow_stacking=True, min_gap=0.0, backend='python',
+                 lateral_balance_scoring=False, stacking_table=None, integer_mm=False):
         self.L = length
         self.W = width
         self.H = height
@@ -85,51 +728,256 @@ class Container:
         self.current_weight = 0.0
         self.items = []
         self.unpacked_items = []
+        
+        # backend='numpy' keeps the boxes in an (N, 6) array and checks whole anchor slices at once
+        if backend == 'numpy' and np is None:
+            raise ImportError("backend='numpy' requires numpy to be installed")
+        if backend not in ('python', 'numpy'):
+            raise ValueError(f"Unknown backend: {backend}")
+        self.backend = backend
+        
+        # lateral_balance_scoring=True adds a left/right weight balance term to the 'balanced' anchor key.
+        # Lateral only: every key starts with (x, z) and the search stops at the first (x, z) slice
+        # with a valid anchor, so a nose/door term would never get to choose between x positions.
+        self.lateral_balance_scoring = lateral_balance_scoring
+        # Optional StackingTable: type/rotation stacking rules become a lookup
+        self.stacking_table = stacking_table
+        
+        # integer_mm=True: all dimensions and positions are whole millimetres (see solve_packing).
+        # Comparisons then use a half-millimetre tolerance, which makes every "a < b - eps",
+        # "a <= b + eps" and "abs(a - b) < eps" test exact on integers.
+        self.integer_mm = integer_mm
+        self.eps = 0.5 if integer_mm else EPSILON
+        
+        # Change log for incremental searches (see BestMoveTable): one entry per added
+        # box since the last removal. Removing or moving a box resets the log.
+        self.revision = 0
+        self._change_log = []
+        self._log_base = 0
+        
+        self._init_indexes()
+
+    def _init_indexes(self):
+        # Indexes of self.items, kept in sync by the placement helpers below
+        self.grid = SpatialGrid()
+        self.extreme_points = ExtremePointSet()
+        self.supports = SupportSurfaceIndex()
+        self.neighbours = NeighbourIndex()
+        self.boxes = BoxArray() if self.backend == 'numpy' else None
+        self.moments = WeightMoments(self.L, self.W, self.H)
+        self.heights = None # HeightMap, built on first use (see height_map)
+        self.stacks = SupportGraph(self.eps)
+        self._next_seq = 0
+
+    _INDEX_ATTRS = ('grid', 'extreme_points', 'supports', 'neighbours', 'boxes', 'moments', 'heights', 'stacks')
+
+    def __getstate__(self):
+        # The indexes are keyed by id(item), which does not survive pickling/deepcopy:
+        # ship the plain data and rebuild them on the other side.
+        state = self.__dict__.copy()
+        for name in self._INDEX_ATTRS:
+            state.pop(name, None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._init_indexes()
+        self.reindex()
+
+    def _index_add(self, item, seq=None):
+        if seq is None:
+            seq = self._next_seq
+            self._next_seq += 1
+        self.grid.insert(item)
+        self.stacks.add(item, self.grid)
+        new_x, new_y, new_z = self.extreme_points.add(item)
+        self.supports.add(item, seq)
+        self.neighbours.add(item)
+        if self.boxes is not None: self.boxes.add(item)
+        self.moments.add(item)
+        if self.heights is not None: self.heights.add(item)
+        
+        p_l, _, p_h = item.get_dimension()
+        self.revision += 1
+        self._change_log.append((self.revision, new_x, new_y, new_z, (item.z + p_h, item.x, item.x + p_l)))
+
+    def _index_remove(self, item):
+        """Unregisters the item and returns its placement sequence number."""
+        self.grid.remove(item)
+        self.stacks.remove(item)
+        self.extreme_points.remove(item)
+        self.neighbours.remove(item)
+        if self.boxes is not None: self.boxes.remove(item)
+        self.moments.remove(item)
+        if self.heights is not None: self.heights.remove(item, self.grid)
+        self._reset_change_log()
+        return self.supports.remove(item)
+
+    def _reset_change_log(self):
+        self.revision += 1
+        self._change_log = []
+        self._log_base = self.revision
+
+    def changes_since(self, revision):
+        """
+        Merged changes of the boxes added after `revision`:
+        (new x faces, new y faces, new top z levels, [(top z, x start, x end)]).
+        Returns None if a box was removed or moved since, i.e. only a full search is safe.
+        """
+        if revision < self._log_base: return None
+        new_x, new_y, new_z, tops = set(), set(), set(), []
+        for rev, xs, ys, zs, top in reversed(self._change_log):
+            if rev <= revision: break
+            new_x.update(xs)
+            new_y.update(ys)
+            new_z.update(zs)
+            tops.append(top)
+        return new_x, new_y, new_z, tops
+
+    def reindex(self):
+        """Rebuilds the indexes from scratch (use after editing self.items directly)."""
+        self.grid.clear()
+        self.extreme_points.clear()
+        self.supports.clear()
+        self.neighbours.clear()
+        if self.boxes is not None: self.boxes.clear()
+        self.moments.clear()
+        if self.heights is not None: self.heights.clear()
+        self.stacks.clear()
+        self._next_seq = 0
+        for placed in self.items:
+            self._index_add(placed)
+        self._reset_change_log()
+
+    def _sync_index(self):
+        # Safety net for callers that append/pop self.items without the helpers
+        if len(self.grid) != len(self.items):
+            self.reindex()
+
+    def height_map(self):
+        """
+        The floor height map, built on first use and kept in sync from then on.
+        Solver runs never build it: manual editing (drops) is what pays for it.
+        """
+        self._sync_index()
+        if self.heights is None:
+            self.heights = HeightMap(self.L, self.W, eps=self.eps)
+            for placed in self.items:
+                self.heights.add(placed)
+        return self.heights
+
+    def drop_height(self, x, y, l, w):
+        """Highest top face of the packed boxes overlapping the footprint (0.0 = floor)."""
+        heights = self.height_map()
+        if x >= 0 and y >= 0 and x + l <= self.L and y + w <= self.W:
+            highest, candidates = heights.region(x, y, l, w)
+            drop_z = 0.0
+            for placed in candidates:
+                p_l, p_w, p_h = placed.get_dimension()
+                if (x < placed.x + p_l - self.eps and x + l > placed.x + self.eps and
+                    y < placed.y + p_w - self.eps and y + w > placed.y + self.eps):
+                    drop_z = max(drop_z, placed.z + p_h)
+            if highest <= drop_z + self.eps:
+                return drop_z
+        
+        # Footprint leaves the floor map, or a box that only grazes an edge cell topped
+        # out higher and may hide a real one: scan exactly
+        drop_z = 0.0
+        for placed in self.grid.query(x, y, l, w):
+            p_l, p_w, p_h = placed.get_dimension()
+            if (x < placed.x + p_l - self.eps and x + l > placed.x + self.eps and
+                y < placed.y + p_w - self.eps and y + w > placed.y + self.eps):
+                drop_z = max(drop_z, placed.z + p_h)
+        return drop_z
+
+    def place_item(self, item, rotation, x, y, z, support_item=None):
+        """
+        Commits a solver placement: sets pose and updates the index. Loads and stack
+        layers come from the support graph, which finds every box the item rests on
+        (support_item is the one the anchor search checked).
+        """
+        item.rotation = rotation
+        item.x, item.y, item.z = x, y, z
+        self.items.append(item)
+        self.current_weight += item.weight
+        self._index_add(item)
+        return item
+
+    def unpack_item(self, packed_idx):
+        """Moves a packed item back to the unpacked list."""
+        if 0 <= packed_idx < len(self.items):
+            item = self.items.pop(packed_idx)
+            self._index_remove(item)
+            self.unpacked_items.append(item)
+            self.current_weight -= item.weight
+            return item
+        return None
+
+    def _coord(self, v):
+        """A manually entered coordinate: whole millimetres in integer_mm mode."""
+        return float(round(v)) if self.integer_mm else float(v)
+
+    def move_item(self, item, x=None, y=None, z=None, rotation=None):
+        """Manual adjustment of an item's pose (keeps the index of packed items in sync)."""
+        if x is not None: item.x = self._coord(x)
+        if y is not None: item.y = self._coord(y)
+        if z is not None: item.z = self._coord(z)
+        if rotation is not None: item.rotation = rotation
+        if item in self.grid:
+            # Keep the original sequence number: the item keeps its slot in self.items
+            seq = self._index_remove(item)
+            self._index_add(item, seq)
+        else:
+            # Unpacked ghost: nothing to reindex, but the plan (and its figure) changed
+            self.revision += 1
+        return item
 
     def can_support(self, item_below, item_above_candidate, candidate_x, candidate_y, candidate_z):
+        if not self._stacking_rules(item_below, item_above_candidate, candidate_z):
+            return False
+        return self._has_support_area(item_below, item_above_candidate, candidate_x, candidate_y)
+
+    def _stacking_rules(self, item_below, item_above_candidate, candidate_z):
+        """Every can_support rule that does not depend on the candidate's x/y position."""
         # 1. Vertical Adjacency Check
         d_below = item_below.get_dimension()
-        d_above = item_above_candidate.get_dimension()
         
         top_z_below = item_below.z + d_below[2]
         
-        if abs(top_z_below - candidate_z) > EPSILON:
+        if abs(top_z_below - candidate_z) > self.eps:
             return False
 
-        # --- PACKAGING TYPE & STACKING RULES ---
-
-        # Rule: Crate on Pallet: ❌ Forbidden
-        if item_below.packaging_type == 1 and item_above_candidate.packaging_type == 2:
-            return False 
+        # Type/rotation rules: one table lookup inside solver runs
+        if self.stacking_table is not None:
+            compatible = self.stacking_table.allows(item_below, item_above_candidate)
+        else:
+            compatible = stacking_compatible(item_below.spec, item_below.rotation,
+                                             item_above_candidate.spec, item_above_candidate.rotation, self.eps)
+        if not compatible or item_below.stack_layer >= self._max_layers():
+            return False
 
-        # Rule: Pallet on Crate: ✅ Allowed ONLY if Pallet is strictly smaller
-        if item_below.packaging_type == 2 and item_above_candidate.packaging_type == 1:
-             if d_above[0] >= d_below[0] - EPSILON or d_above[1] >= d_below[1] - EPSILON:
-                 return False
+        # 4. Weight Limit Check (Load on bottom item)
+        if item_below.current_load_on_top + item_above_candidate.weight > item_below.max_load_on_top:
+            return False
+        
+        return True
 
+    def _max_layers(self):
         # Rule: Global Stacking Limit
         # 20ft Container (< 7000mm): Max 2 layers (Ground + 1 on top)
         # 40ft Container (>= 7000mm): Max 4 layers (High stacking allowed)
-        max_layers = 2 if self.L < 7000 else 4
-        
-        if item_below.stack_layer >= max_layers:
-            return False
-        
-        # General Stability Rule (Pyramid): Heavier on Bottom
-        # MODIFIED: Allow 10% tolerance. E.g., 550kg can sit on 500kg.
-        # This improves Vertical Balance (Top Weight).
-        if item_above_candidate.weight > item_below.weight * 1.10:
-            return False
+        return 2 if self.L < 7000 else 4
 
-        # --- END RULES ---
-
-        # 3. Dimension Scanning (Standard Overhang Check)
-        if d_above[0] > d_below[0] + EPSILON or d_above[1] > d_below[1] + EPSILON:
+    def _pair_rules(self, item_below, item_above_candidate, below_layer):
+        """Packaging, layer, pyramid and overhang rules of one box resting on another."""
+        if below_layer >= self._max_layers():
             return False
+        return stacking_compatible(item_below.spec, item_below.rotation,
+                                   item_above_candidate.spec, item_above_candidate.rotation, self.eps)
 
-        # 4. Weight Limit Check (Load on bottom item)
-        if item_below.current_load_on_top + item_above_candidate.weight > item_below.max_load_on_top:
-            return False
+    def _has_support_area(self, item_below, item_above_candidate, candidate_x, candidate_y):
+        d_below = item_below.get_dimension()
+        d_above = item_above_candidate.get_dimension()
 
         # 5. Surface Area Support Check (Strict No-Overlay Policy)
         # We increase strictness to 95% to prevent overhangs.
@@ -150,162 +998,291 @@ class Container:
             
         return True
         
-    def get_all_valid_anchors(self, item, start_x_limit=0, end_x_limit=None, axis_priority='x', scoring_strategy='balanced'):
-        """
-        scoring_strategy: 'balanced' (Default, aggressively tries to balance weight) 
-                          or 'density' (Tries to pack tightly to fit everything)
-        """
-        if end_x_limit is None: end_x_limit = self.L
-
-        # --- STRICT NO GAP MODE ---
-        gap = 0.0
-
+    def _candidate_axes(self, item, start_x_limit, end_x_limit):
+        """Candidate anchor coordinates per axis (already filtered by the container bounds)."""
         item_l, item_w, item_h = item.get_dimension()
         
-        unique_x = {0, self.L, start_x_limit} 
-        unique_y = {0, self.W}
-        unique_z = {0} 
+        edges_x = self.extreme_points.xs
+        edges_y = self.extreme_points.ys
+
+        unique_x = {0.0, self.L, start_x_limit} 
+        unique_y = {0.0, self.W}
+        unique_z = {0.0} 
         
         if self.allow_stacking:
-            for placed in self.items:
-                if placed.allow_stacking:
-                    unique_z.add(placed.z + placed.get_dimension()[2])
+            unique_z.update(self.extreme_points.zs)
 
         # --- RIGHT WALL SNAPPING ---
         snap_y = self.W - item_w
-        if snap_y >= -EPSILON:
+        if snap_y >= -self.eps:
             unique_y.add(snap_y)
 
         # --- DOOR WALL SNAPPING (Back-Right / Front-Right Corners) ---
         snap_x = self.L - item_l
-        if snap_x >= -EPSILON:
+        if snap_x >= -self.eps:
             unique_x.add(snap_x)
 
-        for placed in self.items:
-            p_l, p_w, p_h = placed.get_dimension()
-            # Standard Coordinates (Right/Front of neighbor)
-            unique_x.add(placed.x)
-            unique_x.add(placed.x + p_l) 
-            
-            unique_y.add(placed.y)
-            unique_y.add(placed.y + p_w)
-            
-            # --- BACK-FILL / REVERSE ALIGNMENT ---
-            if placed.x - item_l >= -EPSILON:
-                    unique_x.add(placed.x - item_l)
-            if placed.x + p_l - item_l >= -EPSILON:
-                unique_x.add(placed.x + p_l - item_l)
+        # Standard Coordinates (Right/Front of neighbor)
+        unique_x.update(edges_x)
+        unique_y.update(edges_y)
+        
+        # --- BACK-FILL / LEFT-ALIGN (REVERSE ALIGNMENT) ---
+        # Only this step depends on the item: shift every neighbour face by the item's size
+        unique_x.update(e - item_l for e in edges_x if e - item_l >= -self.eps)
+        unique_y.update(e - item_w for e in edges_y if e - item_w >= -self.eps)
+
+        valid_x = [x for x in unique_x if x >= start_x_limit - self.eps and x <= (end_x_limit - item_l) + self.eps]
+        valid_y = [y for y in unique_y if y + item_w <= self.W + self.eps]
+        valid_z = [z for z in unique_z if z + item_h <= self.H + self.eps]
+        return valid_x, valid_y, valid_z
+
+    def _check_anchor(self, item, x, y, z, potential_supports):
+        """
+        Returns (is_valid, support_item) for placing item at (x, y, z).
+        potential_supports must already pass _stacking_rules (see _check_slice):
+        only the support area is left to check per anchor.
+        """
+        item_l, item_w, item_h = item.get_dimension()
+        
+        # Support Check
+        support_item = None
+        if z > 0:
+            for p, (px0, px1, py0, py1) in potential_supports:
+                # Footprints must overlap to give any support area
+                if px1 <= x or x + item_l <= px0 or py1 <= y or y + item_w <= py0: continue
+                if self._has_support_area(p, item, x, y):
+                    support_item = p
+                    break 
+            if support_item is None: return False, None
+                
+        # Collision Check
+        safe_gap = 0.0 # Force 0 gap check
+        for other in self.grid.query(x, y, item_l, item_w):
+            o_l, o_w, o_h = other.get_dimension()
+            # Strict AABB collision check
+            if (x < other.x + o_l + safe_gap - self.eps and x + item_l + safe_gap > other.x + self.eps and
+                y < other.y + o_w + safe_gap - self.eps and y + item_w + safe_gap > other.y + self.eps and
+                z < other.z + o_h - self.eps and z + item_h > other.z + self.eps):
+                return False, None
+        return True, support_item
+
+    def _check_slice(self, item, x, z, ys, potential_supports):
+        """Valid anchors of an (x, z) slice as [(y, support_item)], in the order of ys."""
+        if self.boxes is None:
+            # Position-independent rules once per support, not once per anchor
+            if z > 0:
+                potential_supports = [(p, fp) for p, fp in potential_supports if self._stacking_rules(p, item, z)]
+                if not potential_supports: return []
+            found = []
+            for y in ys:
+                is_valid, support_item = self._check_anchor(item, x, y, z, potential_supports)
+                if is_valid: found.append((y, support_item))
+            return found
+        return self._check_slice_numpy(item, x, z, ys, potential_supports)
+
+    def _check_slice_numpy(self, item, x, z, ys, potential_supports):
+        """
+        Batched version of _check_anchor over all y of a slice: the same float
+        comparisons as the Python path, evaluated on arrays of boxes and supports.
+        """
+        item_l, item_w, item_h = item.get_dimension()
+        y_arr = np.asarray(ys, dtype=float)
+        valid = np.ones(len(ys), dtype=bool)
+        
+        # Support Check: position-independent rules per support, then overlap area per (y, support)
+        support_pick = None
+        candidates = []
+        if z > 0:
+            candidates = [(p, fp) for p, fp in potential_supports if self._stacking_rules(p, item, z)]
+            if not candidates: return []
+            fp = np.array([footprint for _, footprint in candidates], dtype=float) # (S, 4): x0, x1, y0, y1
+            overlap_w = np.maximum(0, np.minimum(fp[:, 1], x + item_l) - np.maximum(fp[:, 0], x))
+            overlap_l = np.maximum(0, np.minimum(fp[None, :, 3], y_arr[:, None] + item_w) - np.maximum(fp[None, :, 2], y_arr[:, None]))
+            supported = ~(overlap_w[None, :] * overlap_l < item_l * item_w * 0.95)
+            valid &= supported.any(axis=1)
+            support_pick = supported.argmax(axis=1) # first valid support in placement order
+        
+        # Collision Check: boxes overlapping the slice in x and z, then all y at once
+        boxes = self.boxes.view()
+        if len(boxes):
+            safe_gap = 0.0 # Force 0 gap check
+            near = ((x < boxes[:, 3] + safe_gap - self.eps) & (x + item_l + safe_gap > boxes[:, 0] + self.eps) &
+                    (z < boxes[:, 5] - self.eps) & (z + item_h > boxes[:, 2] + self.eps))
+            near_boxes = boxes[near]
+            if len(near_boxes):
+                hits = ((y_arr[:, None] < near_boxes[None, :, 4] + safe_gap - self.eps) &
+                        (y_arr[:, None] + item_w + safe_gap > near_boxes[None, :, 1] + self.eps))
+                valid &= ~hits.any(axis=1)
+        
+        found = []
+        for pos in np.flatnonzero(valid):
+            support_item = candidates[support_pick[pos]][0] if support_pick is not None else None
+            found.append((ys[pos], support_item))
+        return found
+
+    def _leading_key(self, item, x, y, z, support_item, end_x_limit, scoring_strategy):
+        """
+        Cheap part of the sort key. For 'density' this is the whole key, for
+        'balanced' it stops before the neighbour-dependent bonuses.
+        """
+        item_l, item_w, _ = item.get_dimension()
+        gap_metric = (end_x_limit - (x + item_l)) + (self.W - (y + item_w))
+        dist_to_left = y
+        dist_to_right = abs(self.W - (y + item_w))
+        min_wall_dist = min(dist_to_left, dist_to_right)
+
+        if scoring_strategy == 'density':
+            # DENSITY: Prioritize X, then Z, then Tightest Fit to ANY wall
+            return (x, z, min_wall_dist, gap_metric)
+
+        wall_bonus = 0
+        # Bonus for touching ANY side wall (Left OR Right)
+        if min_wall_dist < self.eps: wall_bonus += 5000
+        # Bonus for Back Wall
+        if x < self.eps: wall_bonus += 2000
+        
+        # STACKING BONUS LOGIC UPDATED
+        stacking_bonus = 0
+        perfect_match_stack = 0
+        
+        if z > 0:
+            # Base bonus for stacking (All must stack up)
+            stacking_bonus = 20000 
             
-            # --- LEFT-ALIGN / REVERSE ALIGNMENT ---
-            if placed.y - item_w >= -EPSILON:
-                unique_y.add(placed.y - item_w)
-            if placed.y + p_w - item_w >= -EPSILON:
-                unique_y.add(placed.y + p_w - item_w)
+            # TWIN STACKING BONUS: If stacking on exact same item, prioritize heavily
+            if support_item and support_item.type_id == item.type_id:
+                perfect_match_stack = 50000
 
-        local_anchors = []
+        return (x, z, -perfect_match_stack, -stacking_bonus, -wall_bonus)
+
+    def _full_key(self, item, x, y, z, leading_key, end_x_limit, scoring_strategy):
+        """Completes a leading key with the neighbour bonuses ('balanced' only)."""
+        if scoring_strategy == 'density':
+            return leading_key
+        item_l, item_w, item_h = item.get_dimension()
+        gap_metric = (end_x_limit - (x + item_l)) + (self.W - (y + item_w))
+        
+        # GROUPING BONUS: Keep Crates with Crates, Pallets with Pallets
+        # (+20 per exact type match, +10 per same packaging type nearby)
+        proximity_threshold = max(item_l, item_w, item_h) * 2
+        type_bonus, grouping_bonus = self.neighbours.grouping_bonus(item, x, y, z, proximity_threshold)
         
-        valid_x = [x for x in unique_x if x >= start_x_limit - EPSILON and x <= (end_x_limit - item_l) + EPSILON]
-        valid_y = [y for y in unique_y if y + item_w <= self.W + EPSILON]
-        valid_z = [z for z in unique_z if z + item_h <= self.H + EPSILON]
+        # Touch check
+        adjacency_bonus = 0
+        if self.neighbours.touches(x, y, z, item_l, item_w):
+            adjacency_bonus += 30 
 
+        # Sort Key: 10 Elements
+        tail = (-grouping_bonus, -type_bonus, -adjacency_bonus, gap_metric, y)
+        if self.lateral_balance_scoring:
+            tail = (abs(self.moments.left_ratio_if(item, y) - 50),) + tail
+        return leading_key + tail
+
+    def get_all_valid_anchors(self, item, start_x_limit=0, end_x_limit=None, axis_priority='x', scoring_strategy='balanced'):
+        """
+        scoring_strategy: 'balanced' (Default, aggressively tries to balance weight) 
+                          or 'density' (Tries to pack tightly to fit everything)
+        Returns every valid anchor as (sort_key, (x, y, z), gap_metric, support_item), best first.
+        """
+        if end_x_limit is None: end_x_limit = self.L
+        self._sync_index()
+
+        # --- STRICT NO GAP MODE ---
+        gap = 0.0
+
+        item_l, item_w, item_h = item.get_dimension()
+        valid_x, valid_y, valid_z = self._candidate_axes(item, start_x_limit, end_x_limit)
+        
+        local_anchors = []
         for z in valid_z:
+            # Support candidates only depend on z: direct lookup of the top faces at this level
+            potential_supports = self.supports.at_level(z) if z > 0 else []
             for x in valid_x:
-                for y in valid_y:
-                    # Support Check
-                    support_item = None
-                    if z > 0:
-                        supported = False
-                        potential_supports = [p for p in self.items if abs((p.z + p.get_dimension()[2]) - z) < EPSILON]
-                        for p in potential_supports:
-                            if self.can_support(p, item, x, y, z):
-                                support_item = p
-                                supported = True
-                                break 
-                        if not supported: continue 
-                            
-                    # Collision Check
-                    collision = False
-                    safe_gap = 0.0 # Force 0 gap check
-                    for other in self.items:
-                        o_l, o_w, o_h = other.get_dimension()
-                        # Strict AABB collision check
-                        if (x < other.x + o_l + safe_gap - EPSILON and x + item_l + safe_gap > other.x + EPSILON and
-                            y < other.y + o_w + safe_gap - EPSILON and y + item_w + safe_gap > other.y + EPSILON and
-                            z < other.z + o_h - EPSILON and z + item_h > other.z + EPSILON):
-                            collision = True
-                            break
-                    if collision: continue
-                    
+                for y, support_item in self._check_slice(item, x, z, valid_y, potential_supports):
                     gap_metric = (end_x_limit - (x + item_l)) + (self.W - (y + item_w))
-                    dist_to_left = y
-                    dist_to_right = abs(self.W - (y + item_w))
-                    min_wall_dist = min(dist_to_left, dist_to_right)
-
-                    if scoring_strategy == 'density':
-                        # DENSITY: Prioritize X, then Z, then Tightest Fit to ANY wall
-                        sort_key = (x, z, min_wall_dist, gap_metric)
-                        local_anchors.append((sort_key, (x, y, z), gap_metric, support_item))
-                    else:
-                        wall_bonus = 0
-                        # Bonus for touching ANY side wall (Left OR Right)
-                        if min_wall_dist < EPSILON: wall_bonus += 5000
-                        # Bonus for Back Wall
-                        if x < EPSILON: wall_bonus += 2000
-                        
-                        # GROUPING BONUS: Keep Crates with Crates, Pallets with Pallets
-                        grouping_bonus = 0
-                        type_bonus = 0
-                        
-                        for other in self.items:
-                            dist = abs(other.x - x) + abs(other.y - y) + abs(other.z - z)
-                            proximity_threshold = max(item_l, item_w, item_h) * 2
-                            
-                            if dist < proximity_threshold:
-                                # High Bonus: Exact Type Match
-                                if other.type_id == item.type_id:
-                                    type_bonus += 20
-                                # Med Bonus: Same Packaging Type
-                                if other.packaging_type == item.packaging_type:
-                                    grouping_bonus += 10
-                        
-                        adjacency_bonus = 0
-                        
-                        # STACKING BONUS LOGIC UPDATED
-                        stacking_bonus = 0
-                        perfect_match_stack = 0
-                        
-                        if z > 0:
-                            # Base bonus for stacking (All must stack up)
-                            stacking_bonus = 20000 
-                            
-                            # TWIN STACKING BONUS: If stacking on exact same item, prioritize heavily
-                            if support_item and support_item.type_id == item.type_id:
-                                perfect_match_stack = 50000
-
-                        for other in self.items:
-                            # Touch check
-                            if (abs(x - (other.x + other.get_dimension()[0])) < EPSILON or abs((x + item_l) - other.x) < EPSILON or \
-                                abs(y - (other.y + other.get_dimension()[1])) < EPSILON or abs((y + item_w) - other.y) < EPSILON) and \
-                                abs(z - other.z) < other.get_dimension()[2]:
-                                adjacency_bonus += 30 
-                                break
-
-                        # Sort Key: 10 Elements
-                        sort_key = (x, z, -perfect_match_stack, -stacking_bonus, -wall_bonus, -grouping_bonus, -type_bonus, -adjacency_bonus, gap_metric, y)
-                        local_anchors.append((sort_key, (x, y, z), gap_metric, support_item))
+                    lead = self._leading_key(item, x, y, z, support_item, end_x_limit, scoring_strategy)
+                    sort_key = self._full_key(item, x, y, z, lead, end_x_limit, scoring_strategy)
+                    local_anchors.append((sort_key, (x, y, z), gap_metric, support_item))
         
         local_anchors.sort(key=lambda item: item[0])
         return local_anchors
 
+    def best_valid_anchor(self, item, start_x_limit=0, end_x_limit=None, scoring_strategy='balanced'):
+        """
+        Same result as get_all_valid_anchors(...)[0] (or None), without building the full list.
+        Candidates are visited in (x, z) order and the search stops at the first (x, z)
+        holding a valid anchor, since every key starts with (x, z). Inside that slice the
+        neighbour bonuses are only computed for anchors tied on the cheap leading terms.
+        """
+        if end_x_limit is None: end_x_limit = self.L
+        self._sync_index()
+        return self._search_best_anchor(item, start_x_limit, end_x_limit, scoring_strategy)[0]
+
+    def _search_best_anchor(self, item, start_x_limit, end_x_limit, scoring_strategy, frontier=None, changes=None):
+        """
+        Returns (best anchor or None, frontier). The frontier is the (x, z) slice the best
+        anchor was found in; every slice before it holds no valid anchor.
+        
+        With a previous frontier and the container changes since (see changes_since),
+        slices before the old frontier are known to be empty apart from what the new
+        boxes changed: anchors there can only appear on new coordinates or on top of a
+        new box (boxes are only added, so collisions and support loads only get worse).
+        Those slices are rechecked only for the new y values unless x or z is new or the
+        slice sits on a new top face.
+        """
+        item_l, item_w, item_h = item.get_dimension()
+        valid_x, valid_y, valid_z = self._candidate_axes(item, start_x_limit, end_x_limit)
+        valid_x.sort()
+        valid_z.sort()
+        supports_by_z = {}
+        
+        dirty_x, fresh_y, dirty_z, tops = set(), [], set(), []
+        if frontier is not None:
+            new_x, new_y, new_z, tops = changes
+            dirty_x = new_x | {e - item_l for e in new_x}
+            candidates_y = new_y | {e - item_w for e in new_y}
+            fresh_y = [y for y in valid_y if y in candidates_y]
+            dirty_z = new_z
+        
+        for x in valid_x:
+            for z in valid_z:
+                ys = valid_y
+                if frontier is not None and (x, z) < frontier and x not in dirty_x and z not in dirty_z:
+                    on_new_top = any(abs(z - top_z) < self.eps and x0 - item_l < x < x1 for top_z, x0, x1 in tops)
+                    if not on_new_top:
+                        ys = fresh_y
+                        if not ys: continue
+                
+                if z not in supports_by_z:
+                    # Support candidates only depend on z: direct lookup of the top faces at this level
+                    supports_by_z[z] = self.supports.at_level(z) if z > 0 else []
+                leads = []
+                for y, support_item in self._check_slice(item, x, z, ys, supports_by_z[z]):
+                    lead = self._leading_key(item, x, y, z, support_item, end_x_limit, scoring_strategy)
+                    leads.append((lead, y, support_item))
+                if not leads: continue
+
+                best_lead = min(entry[0] for entry in leads)
+                best = None
+                for lead, y, support_item in leads:
+                    if lead != best_lead: continue
+                    sort_key = self._full_key(item, x, y, z, lead, end_x_limit, scoring_strategy)
+                    if best is None or sort_key < best[0]:
+                        gap_metric = (end_x_limit - (x + item_l)) + (self.W - (y + item_w))
+                        best = (sort_key, (x, y, z), gap_metric, support_item)
+                return best, (x, z)
+        return None, (float('inf'), float('inf'))
+
     def force_pack_item(self, unpacked_idx, x, y, z):
         """Forces an unpacked item into a specific exact x, y, z position."""
         if 0 <= unpacked_idx < len(self.unpacked_items):
             item = self.unpacked_items.pop(unpacked_idx)
-            item.x = float(x)
-            item.y = float(y)
-            item.z = float(z)
+            item.x = self._coord(x)
+            item.y = self._coord(y)
+            item.z = self._coord(z)
             self.items.append(item)
             self.current_weight += item.weight
+            self._index_add(item)
             return item
         return None
 
@@ -314,84 +1291,396 @@ class Container:
         if 0 <= unpacked_idx < len(self.unpacked_items):
             item = self.unpacked_items[unpacked_idx]
             l, w, h = item.get_dimension()
+            x, y = self._coord(x), self._coord(y)
             
-            # Find the highest Z collision footprint at this X, Y position
-            drop_z = 0.0
-            for placed in self.items:
-                p_l, p_w, p_h = placed.get_dimension()
-                
-                # Check for X-Y coordinate footprint overlap
-                if (x < placed.x + p_l - EPSILON and x + l > placed.x + EPSILON and
-                    y < placed.y + p_w - EPSILON and y + w > placed.y + EPSILON):
-                    
-                    top_z = placed.z + p_h
-                    if top_z > drop_z:
-                        drop_z = top_z
+            # Find the highest Z collision footprint at this X, Y position (height map region query)
+            drop_z = self.drop_height(x, y, l, w)
                         
             # Use the force_pack_item method to move it directly to this calculated resting spot
             return self.force_pack_item(unpacked_idx, x, y, drop_z)
         return None
 
+class BestMoveTable:
+    """
+    Best-move cache for one solver pass: remembers, per (item class, rotation,
+    strategy), where the last anchor search stopped. After a placement only
+    the parts of the search the new box can have changed are redone
+    (see Container._search_best_anchor), so most of the container is not
+    rescanned on every step.
+    """
+    def __init__(self, container):
+        self.container = container
+        self.entries = {} # (spec, rotation, strategy, stacking) -> (revision, frontier)
+
+    def best_anchor(self, item, scoring_strategy='balanced'):
+        container = self.container
+        container._sync_index()
+        key = (item.spec_key(), item.rotation, scoring_strategy, container.allow_stacking)
+        
+        frontier, changes = None, None
+        entry = self.entries.get(key)
+        if entry is not None:
+            changes = container.changes_since(entry[0])
+            if changes is not None: frontier = entry[1]
+        
+        best, frontier = container._search_best_anchor(item, 0, container.L, scoring_strategy,
+                                                       frontier=frontier, changes=changes)
+        self.entries[key] = (container.revision, frontier)
+        return best
+
 def calculate_balance_ratios(container):
     """Returns front_ratio, left_ratio"""
     if container.current_weight == 0: return 50.0, 50.0
     
-    mid_L = container.L / 2
-    mid_W = container.W / 2
-    
-    weight_nose, weight_left = 0.0, 0.0
-    
-    for item in container.items:
-        # Longitudinal
-        item_mid_x = item.x + (item.get_dimension()[0] / 2)
-        if item_mid_x < mid_L: weight_nose += item.weight
-        elif item_mid_x == mid_L: weight_nose += item.weight * 0.5
-            
-        # Lateral
-        item_mid_y = item.y + (item.get_dimension()[1] / 2)
-        if item_mid_y < mid_W: weight_left += item.weight
-        elif item_mid_y == mid_W: weight_left += item.weight * 0.5
+    # Boxes centred exactly on a mid plane count half on each side
+    container._sync_index()
+    moments = container.moments
+    weight_nose = moments['nose'] + moments['nose_tie'] * 0.5
+    weight_left = moments['left'] + moments['left_tie'] * 0.5
 
     ratio_nose = (weight_nose / container.current_weight) * 100
     ratio_left = (weight_left / container.current_weight) * 100
     
     return ratio_nose, ratio_left
 
-def solve_packing(container_l, container_w, container_h, items_data, 
-                  max_weight_kg=28000, 
-                  allow_stacking=True, 
-                  min_gap=0.0,
-                  n_simulations=500,
-                  max_lr_diff=1000,
-                  max_fb_diff=1000):
-    
-    # 0. AUTO-DETECT CONTAINER SIZE
-    is_40ft = container_l > 9000
+# --- SIMULATION HELPERS (module level so worker processes can run them) ---
+def item_rotations(item, container, rotation_flips=frozenset()):
+    """
+    Floor rotations worth searching for an item, in preference order. Rotations that
+    cannot fit the container and the duplicate of a square footprint are dropped.
+    The height is never swapped (no upside down), so too tall means no rotation at all.
+    """
+    # ROTATION LOGIC UPDATE:
+    # Blue items (Type 1) = Prefer Horizontal (Rotation 1), but allow Vertical (0)
+    # This fallback ensures they fit even if Horizontal is too wide.
+    # If item Length > Container Width, force Vertical (Rotation 0)
+    if item.l > container.W:
+         rotations = [0]
+    elif item.packaging_type == 1:
+         # Prefer Horizontal (1) then Vertical (0)
+         rotations = [1, 0]
+    else:
+         # Default for others
+         rotations = [0, 1]
+    if item.type_id in rotation_flips: rotations.reverse()
     
-    # NOTE: We do NOT force allow_stacking to False here for Item creation.
-    # We want Items to be CAPABLE of stacking (if valid), but we control the 
-    # CONTAINER'S stacking permission in the simulation phases below.
-    # This allows the fallback (Phase 2) to work for 40ft containers.
+    if item.h > container.H + container.eps:
+        return []
+    # Square footprint (e.g. round bearings): both rotations give the same search
+    if item.l == item.w:
+        return rotations[:1]
+    # Rotation 0 spans l along the length and w across, rotation 1 the other way round
+    fits = {0: item.w <= container.W + container.eps and item.l <= container.L + container.eps,
+            1: item.l <= container.W + container.eps and item.w <= container.L + container.eps}
+    return [rot for rot in rotations if fits[rot]]
 
-    # 1. Scan and Build All Items List (Combine all Lists 1, 2, 3, 4 etc.)
-    base_items_raw = []
-    for d in items_data:
-        for _ in range(int(d['qty'])):
-            priority = int(d.get('priority', 1)) 
-            packaging_type = int(d.get('packaging_type', 1))
-            max_load = d.get('max_load', None)
-            if max_load is None: max_load = d['weight'] 
-            else: max_load = float(max_load)
-
-            base_items_raw.append(
-                Item(d['name'], d['l'], d['w'], d['h'], d['weight'], 
-                     priority=priority, 
-                     type_id=d.get('type_id', None),
-                     max_load_on_top=max_load,
-                     allow_stacking=allow_stacking, # Uses the argument (default True)
-                     packaging_type=packaging_type)
-            )
+def pack_into_container(container, items_pool, strategy, rotation_flips=frozenset()):
+    # We perform the loop on the provided container and items_pool list
+    # items_pool is modified in place (popped)
+    # rotation_flips: type_ids whose preferred rotation order is reversed (multi-start search)
+    
+    move_table = BestMoveTable(container)
+    
+    if strategy == "Spot_Centric_Fit":
+         while len(items_pool) > 0:
+            global_best_move = None
+            global_best_metric = (float('inf'),) * 12 
+            
+            # Identical items give identical anchor searches: evaluate each class once
+            # per step. The first pool index of a class stays its representative, which
+            # is the item the full scan would have picked (ties keep the earliest index).
+            seen_classes = set()
             
+            for idx, item in enumerate(items_pool):
+                spec = item.spec_key()
+                if spec in seen_classes: continue
+                seen_classes.add(spec)
+                if container.current_weight + item.weight > container.max_weight: continue
+                
+                for rot in item_rotations(item, container, rotation_flips):
+                    item.rotation = rot
+                    best_a = move_table.best_anchor(item, scoring_strategy='balanced')
+                    if best_a:
+                        current_metric = best_a[0]
+                        if current_metric < global_best_metric:
+                            global_best_metric = current_metric
+                            global_best_move = (idx, rot, best_a[1], best_a[3])
+            
+            if global_best_move:
+                idx, rot, (x,y,z), support = global_best_move
+                winner = items_pool.pop(idx)
+                container.place_item(winner, rot, x, y, z, support)
+            else:
+                container.unpacked_items.extend(items_pool)
+                break
+                
+    elif strategy == "Density_First_Fit":
+         while len(items_pool) > 0:
+            found_fit = False
+            failed_classes = set() # a copy of an item that did not fit will not fit either
+            for idx, item in enumerate(items_pool):
+                spec = item.spec_key()
+                if spec in failed_classes: continue
+                failed_classes.add(spec)
+                if container.current_weight + item.weight > container.max_weight: continue
+                
+                best_anchor = None
+                best_rot = 0
+                
+                for rot in item_rotations(item, container, rotation_flips):
+                    item.rotation = rot
+                    anchor = move_table.best_anchor(item, scoring_strategy='density')
+                    if anchor:
+                        if best_anchor is None or anchor[0] < best_anchor[0]:
+                            best_anchor = anchor
+                            best_rot = rot
+                if best_anchor:
+                    winner = items_pool.pop(idx)
+                    x, y, z = best_anchor[1]
+                    container.place_item(winner, best_rot, x, y, z, best_anchor[3])
+                    found_fit = True
+                    break 
+            if not found_fit:
+                container.unpacked_items.extend(items_pool)
+                break
+
+def score_container(container):
+    """Lower is better: every unpacked item outweighs any balance difference."""
+    unpacked_count = len(container.unpacked_items)
+    ratio_nose, _ = calculate_balance_ratios(container)
+    
+    score = unpacked_count * 10000
+    score += abs(ratio_nose - 50) * 10
+    return score
+
+def run_packing_strategy(strat, load_order, container_args, rotation_flips=frozenset()):
+    """One full simulation (first pass + rescue pass). Returns (score, container)."""
+    (container_l, container_w, container_h, max_weight_kg, initial_stacking, min_gap, backend, lateral_balance_scoring,
+     stacking_table, integer_mm) = container_args
+    
+    # 1. Initialize Container
+    # User Request: "scan what item is left out then the item can be stack up"
+    container = Container(container_l, container_w, container_h, 
+                        max_weight=max_weight_kg, 
+                        allow_stacking=initial_stacking, 
+                        min_gap=min_gap,
+                        backend=backend,
+                        lateral_balance_scoring=lateral_balance_scoring,
+                        stacking_table=stacking_table,
+                        integer_mm=integer_mm)
+    
+    # Runs share the Item objects: only their placement state is per run (see PlanState)
+    for item in load_order:
+        item.reset_placement()
+    current_pool = list(load_order)
+    
+    # 2. First Pass Packing
+    pack_into_container(container, current_pool, strat, rotation_flips)
+    
+    # 3. Rescue Pass (Safety Net for Leftovers)
+    if len(container.unpacked_items) > 0:
+        # Enable stacking to fit the rest (redundant if initial is True, but good for safety)
+        container.allow_stacking = True
+        
+        # Retrieve leftovers
+        leftovers = container.unpacked_items
+        container.unpacked_items = [] # Clear unpacked list
+        
+        # Sort leftovers (Heavier/Bigger first for better stacking)
+        leftovers.sort(key=lambda x: (x.weight, x.base_area), reverse=True)
+        
+        # Try packing again
+        pack_into_container(container, leftovers, strat, rotation_flips)
+
+    # Scoring
+    return score_container(container), container
+
+class PlanState:
+    """
+    Compact placement record of one simulation run over a fixed item list:
+    parallel arrays of position, rotation, stack layer and load, indexed like
+    the item list, plus the packed/unpacked order. The items themselves only
+    carry the static specs that all runs share, so keeping a run is a copy
+    of these arrays instead of a deepcopy of every Item.
+    """
+    __slots__ = ('x', 'y', 'z', 'rotation', 'stack_layer', 'load', 'packed', 'unpacked', 'allow_stacking')
+
+    @classmethod
+    def capture(cls, container, items):
+        state = cls()
+        state.x = [item.x for item in items]
+        state.y = [item.y for item in items]
+        state.z = [item.z for item in items]
+        state.rotation = [item.rotation for item in items]
+        state.stack_layer = [item.stack_layer for item in items]
+        state.load = [item.current_load_on_top for item in items]
+        slot = {id(item): i for i, item in enumerate(items)}
+        state.packed = [slot[id(item)] for item in container.items]
+        state.unpacked = [slot[id(item)] for item in container.unpacked_items]
+        state.allow_stacking = container.allow_stacking
+        return state
+
+    def materialize(self, items, container_args):
+        """Builds a standalone Container of fresh Item copies placed as recorded."""
+        (container_l, container_w, container_h, max_weight_kg, _, min_gap, backend, lateral_balance_scoring,
+         _, integer_mm) = container_args
+        container = Container(container_l, container_w, container_h, 
+                            max_weight=max_weight_kg, 
+                            allow_stacking=self.allow_stacking, 
+                            min_gap=min_gap,
+                            backend=backend,
+                            lateral_balance_scoring=lateral_balance_scoring,
+                            integer_mm=integer_mm)
+        
+        def placed_copy(i):
+            item = copy.copy(items[i])
+            item.x, item.y, item.z = self.x[i], self.y[i], self.z[i]
+            item.rotation = self.rotation[i]
+            item.stack_layer = self.stack_layer[i]
+            item.current_load_on_top = self.load[i]
+            return item
+        
+        container.items = [placed_copy(i) for i in self.packed]
+        container.unpacked_items = [placed_copy(i) for i in self.unpacked]
+        container.current_weight = sum(item.weight for item in container.items)
+        container.reindex()
+        return container
+
+PACKING_STRATEGIES = ["Spot_Centric_Fit", "Density_First_Fit"]
+
+def simulation_params(sim_id, seed, is_40ft, type_ids):
+    """
+    Deterministic parameters of multi-start run sim_id: (strategy, split ratios,
+    load order swap count, rotation flips, order seed). The first runs, one per
+    strategy, are the unperturbed baseline plans.
+    """
+    strat = PACKING_STRATEGIES[sim_id % len(PACKING_STRATEGIES)]
+    if sim_id < len(PACKING_STRATEGIES):
+        return strat, None, 0, frozenset(), None
+    
+    rd = random.Random(f"{seed}:{sim_id}")
+    if is_40ft:
+        back, middle = SPLIT_RATIOS_40FT
+        split_ratios = (back + rd.uniform(-0.05, 0.05), middle + rd.uniform(-0.05, 0.05))
+    else:
+        back, band_min, band_max = SPLIT_RATIOS_20FT
+        shift = rd.uniform(-2.0, 2.0)
+        split_ratios = (back + rd.uniform(-0.03, 0.03), band_min + shift, band_max + shift)
+    n_swaps = rd.randint(0, 8)
+    rotation_flips = frozenset(t for t in type_ids if rd.random() < 0.25)
+    return strat, split_ratios, n_swaps, rotation_flips, rd.random()
+
+def perturb_load_order(load_order, n_swaps, order_seed):
+    """Swaps n_swaps random neighbouring pairs of the load order (returns a new list)."""
+    order = list(load_order)
+    if len(order) < 2: return order
+    rd = random.Random(order_seed)
+    for _ in range(n_swaps):
+        pos = rd.randrange(len(order) - 1)
+        order[pos], order[pos + 1] = order[pos + 1], order[pos]
+    return order
+
+def plan_rank(container, max_lr_diff, max_fb_diff):
+    """
+    Sort key of a finished plan: fewest unpacked items first (cargo left behind always
+    outweighs balance, as in score_container), then plans inside the left/right and
+    nose/door weight difference limits (kg), then the usual score.
+    """
+    stats = get_container_stats(container)
+    violates = (abs(stats['weight_left'] - stats['weight_right']) > max_lr_diff or
+                abs(stats['weight_nose'] - stats['weight_door']) > max_fb_diff)
+    return (len(container.unpacked_items), violates, score_container(container))
+
+def run_simulation_batch(sim_ids, base_items_raw, is_40ft, seed, container_args, max_lr_diff, max_fb_diff, deadline=None):
+    """
+    Runs a batch of multi-start simulations. Returns ((rank, sim_id, container) of its
+    best plan or None, number of simulations run). Once time.time() passes deadline the
+    remaining simulations are skipped, except the baseline ones.
+    """
+    # Batch-local units (cheap: the specs are shared ItemTypes). Runs of this batch reuse
+    # them one after another, but batches running on threads must not share poses.
+    items = [copy.copy(item) for item in base_items_raw]
+    type_ids = sorted({item.type_id for item in items})
+    best = None
+    n_done = 0
+    for sim_id in sim_ids:
+        if deadline is not None and sim_id >= len(PACKING_STRATEGIES) and time.time() > deadline:
+            break
+        strat, split_ratios, n_swaps, rotation_flips, order_seed = simulation_params(sim_id, seed, is_40ft, type_ids)
+        load_order = build_load_order(items, is_40ft, split_ratios)
+        if n_swaps: load_order = perturb_load_order(load_order, n_swaps, order_seed)
+        _, container = run_packing_strategy(strat, load_order, container_args, rotation_flips)
+        
+        # Keep only the compact placement record: the next run reuses the same items
+        rank = plan_rank(container, max_lr_diff, max_fb_diff)
+        n_done += 1
+        if best is None or (rank, sim_id) < best[:2]:
+            best = (rank, sim_id, PlanState.capture(container, items))
+    
+    if best is None: return None, n_done
+    rank, sim_id, state = best
+    return (rank, sim_id, state.materialize(items, container_args)), n_done
+
+def _run_job(job):
+    fn, args = job
+    return fn(*args)
+
+def iter_jobs(fn, jobs, max_workers=None):
+    """
+    Runs fn(*args) for every args tuple in jobs and yields (job index, result) as jobs finish.
+    Uses a process pool; falls back to a thread pool where processes are not
+    available (restricted platforms, unpicklable arguments). max_workers=1 runs inline.
+    Closing the generator early cancels the jobs that have not started yet.
+    """
+    if max_workers is None:
+        max_workers = min(len(jobs), os.cpu_count() or 1)
+    if max_workers <= 1 or len(jobs) <= 1:
+        for idx, args in enumerate(jobs):
+            yield idx, fn(*args)
+        return
+    
+    yielded = False
+    for executor_cls in (concurrent.futures.ProcessPoolExecutor, concurrent.futures.ThreadPoolExecutor):
+        pool = None
+        try:
+            pool = executor_cls(max_workers=max_workers)
+            futures = {pool.submit(_run_job, (fn, args)): idx for idx, args in enumerate(jobs)}
+            for future in concurrent.futures.as_completed(futures):
+                result = future.result()
+                yielded = True
+                yield futures[future], result
+            return
+        except (OSError, NotImplementedError, pickle.PicklingError, concurrent.futures.process.BrokenProcessPool):
+            # Only fall back to threads if nothing has been handed out yet
+            if yielded or executor_cls is concurrent.futures.ThreadPoolExecutor: raise
+        finally:
+            if pool is not None: pool.shutdown(wait=False, cancel_futures=True)
+
+# Default part split: 40ft = (back share, middle fill share), 20ft = (back share, back band min %, max %)
+SPLIT_RATIOS_40FT = (0.20, 0.60)
+SPLIT_RATIOS_20FT = (0.42, 40.0, 45.0)
+
+def fill_weight_band(candidates, current_weight, min_weight, max_weight=None):
+    """
+    Greedy running-total fill: walks candidates in order and takes items while
+    current_weight is below min_weight, skipping any item that would push it past
+    max_weight (None = no upper bound). Returns (taken, rest, new weight); both lists
+    keep the candidate order. One pass, no re-summing.
+    """
+    taken, rest = [], []
+    for item in candidates:
+        if current_weight < min_weight and (max_weight is None or current_weight + item.weight <= max_weight):
+            taken.append(item)
+            current_weight += item.weight
+        else:
+            rest.append(item)
+    return taken, rest, current_weight
+
+def build_load_order(base_items_raw, is_40ft, split_ratios=None):
+    """Splits the items into back/middle/front parts by weight and returns the load order."""
+    if split_ratios is None:
+        split_ratios = SPLIT_RATIOS_40FT if is_40ft else SPLIT_RATIOS_20FT
+    
     # Calculate Total Weight for Global Split Logic
     total_batch_weight = sum(item.weight for item in base_items_raw)
     
@@ -406,7 +1695,7 @@ def solve_packing(container_l, container_w, container_h, items_data,
         # User request: "balance and long one u can put in the middle"
         # Strategy: 20% Back | 60% Middle (Heavy/Long) | 20% Front
         
-        target_a = 0.20 * total_batch_weight 
+        target_a = split_ratios[0] * total_batch_weight 
         target_c = 0.20 * total_batch_weight
         
         # 1. Identify "Container Spanning" items vs "Mid-Long" items vs Others
@@ -434,13 +1723,8 @@ def solve_packing(container_l, container_w, container_h, items_data,
         # Fill remainder of A with Tallest from 'others' to create a wall
         # Sort by Height, then Weight
         others.sort(key=lambda x: (x.h, x.weight), reverse=True)
-        remaining_others = []
-        for item in others:
-            if current_a_weight < target_a:
-                part_a.append(item)
-                current_a_weight += item.weight
-            else:
-                remaining_others.append(item)
+        wall, remaining_others, current_a_weight = fill_weight_band(others, current_a_weight, target_a)
+        part_a.extend(wall)
         
         # 3. Fill Part B (Middle) - The "Long Ones" and Heavy Pallets
         # Put the "can_go_b" (Mid-Long) items here explicitly
@@ -451,16 +1735,11 @@ def solve_packing(container_l, container_w, container_h, items_data,
         # This fixes the issue of pallets being scattered and not stacking.
         remaining_others.sort(key=lambda x: (x.type_id, x.weight, x.h), reverse=True)
         
-        remaining_for_c = []
         current_b_weight = sum(i.weight for i in part_b)
-        target_b_fill = total_batch_weight * 0.60 # Approximate middle target
+        target_b_fill = total_batch_weight * split_ratios[1] # Approximate middle target
         
-        for item in remaining_others:
-            if current_b_weight < target_b_fill:
-                part_b.append(item)
-                current_b_weight += item.weight
-            else:
-                remaining_for_c.append(item)
+        heavy, remaining_for_c, current_b_weight = fill_weight_band(remaining_others, current_b_weight, target_b_fill)
+        part_b.extend(heavy)
                 
         # 4. Part C (Front) gets the rest
         part_c.extend(remaining_for_c)
@@ -468,40 +1747,29 @@ def solve_packing(container_l, container_w, container_h, items_data,
     # --- STRATEGY: 20ft (2-PART SPLIT) ---
     else:
         # Target Part A (Back) ~42% to allow Part B bleed-over
-        target_a = 0.42 * total_batch_weight
+        target_a = split_ratios[0] * total_batch_weight
         pool = sorted(base_items_raw, key=lambda x: (x.h, x.weight), reverse=True)
-        
-        current_a_weight = 0.0
-        for item in pool:
-            if current_a_weight < target_a:
-                part_a.append(item)
-                current_a_weight += item.weight
-            else:
-                part_b.append(item)
+        part_a, part_b, current_a_weight = fill_weight_band(pool, 0.0, target_a)
 
-        # 20ft Rebalancing Loop
-        max_iterations = 2000 
-        min_a_ratio = 40.0
-        max_a_ratio = 45.0
+        # 20ft Rebalancing: bring Part A into the back weight band in one pass,
+        # moving only items that don't overshoot the other edge of the band
+        min_a_weight = split_ratios[1] / 100 * total_batch_weight
+        max_a_weight = split_ratios[2] / 100 * total_batch_weight
         
-        for _ in range(max_iterations):
-            wt_a = sum(i.weight for i in part_a)
-            ratio_a = (wt_a / total_batch_weight * 100) if total_batch_weight > 0 else 0
-            if min_a_ratio <= ratio_a <= max_a_ratio: break 
-            
-            if ratio_a > max_a_ratio:
-                candidates = [i for i in part_a if i.l < 3000]
-                if not candidates: break
-                candidates.sort(key=lambda x: (x.h, -x.weight))
-                item_to_move = candidates[0]
-                part_a.remove(item_to_move)
-                part_b.append(item_to_move)
-            elif ratio_a < min_a_ratio:
-                if not part_b: break
-                part_b.sort(key=lambda x: (-x.h, -x.weight))
-                item_to_move = part_b[0]
-                part_b.remove(item_to_move)
-                part_a.append(item_to_move)
+        if current_a_weight > max_a_weight:
+            # Too heavy: hand the lowest short items (heaviest first) to Part B
+            candidates = sorted((i for i in part_a if i.l < 3000), key=lambda x: (x.h, -x.weight))
+            moved, _, _ = fill_weight_band(candidates, 0.0, current_a_weight - max_a_weight,
+                                           current_a_weight - min_a_weight)
+            moved_ids = {id(i) for i in moved}
+            part_a = [i for i in part_a if id(i) not in moved_ids]
+            part_b.extend(moved)
+        elif current_a_weight < min_a_weight and total_batch_weight > 0:
+            # Too light: pull the tallest/heaviest items forward from Part B
+            part_b.sort(key=lambda x: (-x.h, -x.weight))
+            moved, part_b, _ = fill_weight_band(part_b, 0.0, min_a_weight - current_a_weight,
+                                                max_a_weight - current_a_weight)
+            part_a.extend(moved)
 
     # 3. Final Sort Internally - FIXED SORTING PRIORITY FOR LONG ITEMS
     def sort_key_smart_vertical(x):
@@ -534,181 +1802,126 @@ def solve_packing(container_l, container_w, container_h, items_data,
     else:
         final_load_order = part_a + part_b
 
-    # --- HELPER FUNCTION FOR SIMULATION ---
-    def pack_into_container(container, items_pool, strategy):
-        # We perform the loop on the provided container and items_pool list
-        # items_pool is modified in place (popped)
-        
-        if strategy == "Spot_Centric_Fit":
-             while len(items_pool) > 0:
-                global_best_move = None
-                global_best_metric = (float('inf'),) * 12 
-                
-                for idx, item in enumerate(items_pool):
-                    if container.current_weight + item.weight > container.max_weight: continue
-                    
-                    # ROTATION LOGIC UPDATE:
-                    # Blue items (Type 1) = Prefer Horizontal (Rotation 1), but allow Vertical (0)
-                    # This fallback ensures they fit even if Horizontal is too wide.
-                    # If item Length > Container Width, force Vertical (Rotation 0)
-                    
-                    if item.l > container.W:
-                         rotations = [0]
-                    elif item.packaging_type == 1:
-                         # Prefer Horizontal (1) then Vertical (0)
-                         rotations = [1, 0]
-                    else:
-                         # Default for others
-                         rotations = [0, 1]
-                    
-                    for rot in rotations:
-                        item.rotation = rot
-                        anchors = container.get_all_valid_anchors(item, scoring_strategy='balanced')
-                        if anchors:
-                            best_a = anchors[0]
-                            current_metric = best_a[0]
-                            if current_metric < global_best_metric:
-                                global_best_metric = current_metric
-                                global_best_move = (idx, rot, best_a[1], best_a[3])
-                
-                if global_best_move:
-                    idx, rot, (x,y,z), support = global_best_move
-                    winner = items_pool.pop(idx)
-                    winner.rotation = rot
-                    winner.x, winner.y, winner.z = x, y, z
-                    if support:
-                        support.current_load_on_top += winner.weight
-                        winner.stack_layer = support.stack_layer + 1
-                    else:
-                        winner.stack_layer = 1
-                    container.items.append(winner)
-                    container.current_weight += winner.weight
-                else:
-                    container.unpacked_items.extend(items_pool)
-                    break
-                    
-        elif strategy == "Density_First_Fit":
-             while len(items_pool) > 0:
-                found_fit = False
-                for idx, item in enumerate(items_pool):
-                    if container.current_weight + item.weight > container.max_weight: continue
-                    
-                    # ROTATION LOGIC UPDATE (Same as above)
-                    if item.l > container.W:
-                         rotations = [0]
-                    elif item.packaging_type == 1:
-                         rotations = [1, 0]
-                    else:
-                         rotations = [0, 1]
-
-                    best_anchor = None
-                    best_rot = 0
-                    
-                    for rot in rotations:
-                        item.rotation = rot
-                        anchors = container.get_all_valid_anchors(item, scoring_strategy='density')
-                        if anchors:
-                            if best_anchor is None or anchors[0][0] < best_anchor[0]:
-                                best_anchor = anchors[0]
-                                best_rot = rot
-                    if best_anchor:
-                        winner = items_pool.pop(idx)
-                        winner.rotation, winner.x, winner.y, winner.z = best_rot, best_anchor[1][0], best_anchor[1][1], best_anchor[1][2]
-                        support = best_anchor[3]
-                        if support:
-                            support.current_load_on_top += winner.weight
-                            winner.stack_layer = support.stack_layer + 1
-                        else:
-                            winner.stack_layer = 1
-                        container.items.append(winner)
-                        container.current_weight += winner.weight
-                        found_fit = True
-                        break 
-                if not found_fit:
-                    container.unpacked_items.extend(items_pool)
-                    break
+    return final_load_order
 
-    # 5. PACKING EXECUTION
-    best_container = None
-    best_score = float('inf')
+def solve_packing(container_l, container_w, container_h, items_data, 
+                  max_weight_kg=28000, 
+                  allow_stacking=True, 
+                  min_gap=0.0,
+                  n_simulations=500,
+                  max_lr_diff=1000,
+                  max_fb_diff=1000,
+                  backend='python',
+                  max_workers=None,
+                  seed=0,
+                  time_budget_s=None,
+                  on_progress=None,
+                  lateral_balance_scoring=False,
+                  integer_mm=False):
     
-    packing_strategies = ["Spot_Centric_Fit", "Density_First_Fit"]
+    # integer_mm=True: snap the container and every item dimension to whole millimetres
+    # here, once. Every anchor is then a sum of whole-mm edges, so near-duplicate
+    # anchors (e.g. 1199.9999 vs 1200) collapse into one and all comparisons are exact.
+    # Items round up and the container rounds down, so a snapped plan never packs more
+    # than the real boxes allow. Values stay floats (whole-mm valued) in both modes.
+    if integer_mm:
+        # round(v, 6) first: unit-conversion noise like 1200.0000001 is not a real extra mm
+        snap_up = lambda v: float(math.ceil(round(float(v), 6)))
+        snap_down = lambda v: float(math.floor(round(float(v), 6)))
+    else:
+        snap_up = snap_down = lambda v: v
+    container_l, container_w, container_h = snap_down(container_l), snap_down(container_w), snap_down(container_h)
     
-    for strat in packing_strategies:
-        # 1. Initialize Container
-        # User Request: "scan what item is left out then the item can be stack up"
-        # Strategy Update:
-        # For 40ft: Start with Floor Loading (Stacking Disabled) to spread weight/volume, then fill gaps.
-        # For 20ft: Start with Stacking ENABLED immediately because floor space is the limiting factor.
-        
-        initial_stacking = True if not is_40ft else False
-        
-        container = Container(container_l, container_w, container_h, 
-                            max_weight=max_weight_kg, 
-                            allow_stacking=initial_stacking, 
-                            min_gap=min_gap)
-        
-        current_pool = copy.deepcopy(final_load_order)
-        
-        # 2. First Pass Packing
-        pack_into_container(container, current_pool, strat)
-        
-        # 3. Rescue Pass (Safety Net for Leftovers)
-        if len(container.unpacked_items) > 0:
-            # Enable stacking to fit the rest (redundant if initial is True, but good for safety)
-            container.allow_stacking = True
-            
-            # Retrieve leftovers
-            leftovers = container.unpacked_items
-            container.unpacked_items = [] # Clear unpacked list
-            
-            # Sort leftovers (Heavier/Bigger first for better stacking)
-            leftovers.sort(key=lambda x: (x.weight, x.base_area), reverse=True)
-            
-            # Try packing again
-            pack_into_container(container, leftovers, strat)
+    # 0. AUTO-DETECT CONTAINER SIZE
+    is_40ft = container_l > 9000
+    
+    # NOTE: We do NOT force allow_stacking to False here for Item creation.
+    # We want Items to be CAPABLE of stacking (if valid), but we control the 
+    # CONTAINER'S stacking permission in the simulation phases below.
+    # This allows the fallback (Phase 2) to work for 40ft containers.
 
-        # Scoring
-        unpacked_count = len(container.unpacked_items)
-        ratio_nose, _ = calculate_balance_ratios(container)
-        
-        score = unpacked_count * 10000
-        score += abs(ratio_nose - 50) * 10
-            
-        if score < best_score:
-            best_score = score
-            best_container = container
+    # 1. Scan and Build All Items List (Combine all Lists 1, 2, 3, 4 etc.)
+    base_items_raw = []
+    item_types = []
+    for d in items_data:
+        priority = int(d.get('priority', 1)) 
+        packaging_type = int(d.get('packaging_type', 1))
+        max_load = d.get('max_load', None)
+        if max_load is None: max_load = d['weight'] 
+        else: max_load = float(max_load)
+
+        # One shared ItemType per line, every unit only carries its own placement
+        item_type = ItemType(d['name'], snap_up(d['l']), snap_up(d['w']), snap_up(d['h']), d['weight'], 
+                             priority=priority, 
+                             type_id=d.get('type_id', None),
+                             max_load_on_top=max_load,
+                             allow_stacking=allow_stacking, # Uses the argument (default True)
+                             packaging_type=packaging_type)
+        item_types.append(item_type)
+        for _ in range(int(d['qty'])):
+            base_items_raw.append(Item.from_type(item_type))
             
-    return best_container
+    # 5. PACKING EXECUTION
+    # For 40ft: Start with Floor Loading (Stacking Disabled) to spread weight/volume, then fill gaps.
+    # For 20ft: Start with Stacking ENABLED immediately because floor space is the limiting factor.
+    initial_stacking = True if not is_40ft else False
+    # Type/rotation stacking rules are evaluated once here instead of per anchor
+    stacking_table = StackingTable(item_types, eps=0.5 if integer_mm else EPSILON)
+    container_args = (container_l, container_w, container_h, max_weight_kg, initial_stacking, min_gap, backend,
+                      lateral_balance_scoring, stacking_table, integer_mm)
+    
+    # Multi-start search: n_simulations independent runs (baseline plans first, then
+    # seeded perturbations of the load order, part split and rotation preferences),
+    # spread over worker processes in batches.
+    # Anytime: with time_budget_s the runs stop at the deadline and the best plan so far
+    # is returned (the two baseline runs always complete). on_progress(best, stats) is
+    # called whenever a finished batch improves the best plan.
+    start_time = time.time()
+    deadline = start_time + time_budget_s if time_budget_s is not None else None
+    n_runs = max(int(n_simulations), len(PACKING_STRATEGIES))
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    # Small contiguous batches: early simulations report early, workers stay balanced
+    batch_size = 1 if max_workers <= 1 else 4
+    batches = [list(range(b, min(b + batch_size, n_runs))) for b in range(0, n_runs, batch_size)]
+    jobs = [(sim_ids, base_items_raw, is_40ft, seed, container_args, max_lr_diff, max_fb_diff, deadline) for sim_ids in batches]
+    
+    best = None
+    n_completed = 0
+    for _, (batch_best, n_done) in iter_jobs(run_simulation_batch, jobs, max_workers=max_workers):
+        n_completed += n_done
+        # Best rank wins, ties go to the lower simulation id (baseline Spot_Centric_Fit first)
+        if batch_best is not None and (best is None or batch_best[:2] < best[:2]):
+            best = batch_best
+            if on_progress is not None:
+                (_, violates, score), _, container = best
+                stats = get_container_stats(container)
+                on_progress(container, {
+                    "completed": n_completed, "total": n_runs,
+                    "elapsed_s": time.time() - start_time,
+                    "score": score, "within_limits": not violates,
+                    "unpacked_count": stats['unpacked_count'],
+                    "balance_ratio_len": stats['balance_ratio_len'],
+                })
+    return best[2]
 
 def get_container_stats(container):
     total_vol = container.L * container.W * container.H
-    used_vol = sum(i.vol for i in container.items)
-    total_weight = sum(i.weight for i in container.items)
-    
-    w_nose, w_door = 0.0, 0.0
-    w_left, w_right = 0.0, 0.0
-    w_bottom, w_top = 0.0, 0.0
     mid_L, mid_W, mid_H = container.L/2, container.W/2, container.H/2
     
-    moment_x = 0.0
-    moment_y = 0.0
-    moment_z = 0.0
-    
-    for item in container.items:
-        cx = item.x + item.get_dimension()[0]/2
-        cy = item.y + item.get_dimension()[1]/2
-        cz = item.z + item.get_dimension()[2]/2
-        moment_x += cx * item.weight
-        moment_y += cy * item.weight
-        moment_z += cz * item.weight
-        
-        if cx < mid_L: w_nose += item.weight
-        else: w_door += item.weight
-        if cy < mid_W: w_left += item.weight
-        else: w_right += item.weight
-        if cz < mid_H: w_bottom += item.weight
-        else: w_top += item.weight
+    # O(1): read the running totals kept by the container's placement helpers
+    container._sync_index()
+    moments = container.moments
+    used_vol = moments['vol']
+    total_weight = moments['weight']
+    
+    w_nose, w_door = moments['nose'], moments['door']
+    w_left, w_right = moments['left'], moments['right']
+    w_bottom, w_top = moments['bottom'], moments['top']
+    
+    moment_x = moments['moment_x']
+    moment_y = moments['moment_y']
+    moment_z = moments['moment_z']
 
     if total_weight > 0:
         cog_x, cog_y, cog_z = moment_x/total_weight, moment_y/total_weight, moment_z/total_weight
@@ -736,63 +1949,155 @@ def get_container_stats(container):
         "cog_x": cog_x, "cog_y": cog_y, "cog_z": cog_z
     }
 
-def visualize_container(container, highlight_name=None):
-    fig = go.Figure()
-    L, W, H = container.L, container.W, container.H
+PLAN_STATUS_TEXT = {
+    'ok': "✅ Inside",
+    'out_of_bounds': "❌ OUT OF BOUNDS",
+    'collision': "❌ COLLISION DETECTED",
+    'unsupported': "⚠️ UNSUPPORTED",
+    'stacking': "⚠️ STACKING RULE BROKEN",
+    'overloaded': "⚠️ OVERLOADED",
+}
+
+def validate_plan(container):
+    """
+    Full check of the packed items, e.g. after manual edits. Sweep-and-prune along x
+    finds every pair of boxes that overlap or touch (O(n log n + pairs)); the narrow
+    phase then sorts them into collisions and resting contacts.
     
-    # 1. Container Wireframe
-    cage_lines = [
-        ([0, L], [0, 0], [0, 0]), ([0, L], [W, W], [0, 0]), ([0, L], [0, 0], [H, H]), ([0, L], [W, W], [H, H]),
-        ([0, 0], [0, W], [0, 0]), ([L, L], [0, W], [0, 0]), ([0, 0], [0, W], [H, H]), ([L, L], [0, W], [H, H]),
-        ([0, 0], [0, 0], [0, H]), ([L, L], [0, 0], [0, H]), ([0, 0], [W, W], [0, H]), ([L, L], [W, W], [0, H])
+    Returns a dict (item indices refer to container.items):
+      collisions: [(i, j)] overlapping pairs, i < j
+      out_of_bounds: [i] boxes sticking out of the container
+      unsupported: [i] boxes above the floor with < 95% of their base resting on tops
+      stacking_violations: [(below, above)] contacts breaking the can_support rules
+      overloaded: [i] boxes carrying more than max_load_on_top (load split by contact area)
+      overweight: total weight above container.max_weight
+      supports: {i: [(below, contact area)]}, layers: [stack layer by geometry]
+      loads: [load on top], status: [per item key of PLAN_STATUS_TEXT]
+    """
+    L, W, H, eps = container.L, container.W, container.H, container.eps
+    items = container.items
+    n = len(items)
+    boxes = []
+    for item in items:
+        l, w, h = item.get_dimension()
+        boxes.append((item.x, item.y, item.z, item.x + l, item.y + w, item.z + h))
+    
+    out_of_bounds = [i for i, (x0, y0, z0, x1, y1, z1) in enumerate(boxes)
+                     if x0 < -eps or y0 < -eps or z0 < -eps or
+                        x1 > L + eps or y1 > W + eps or z1 > H + eps]
+    
+    # Broad phase: sweep along x, keeping the boxes whose x range is still open
+    collisions = []
+    supports = {i: [] for i in range(n)}
+    active = []
+    for i in sorted(range(n), key=lambda k: boxes[k][0]):
+        x0, y0, z0, x1, y1, z1 = boxes[i]
+        active = [j for j in active if boxes[j][3] > x0 - eps]
+        for j in active:
+            a0, b0, c0, a1, b1, c1 = boxes[j]
+            if y0 > b1 + eps or b0 > y1 + eps: continue
+            # Narrow phase
+            if (x0 < a1 - eps and x1 > a0 + eps and y0 < b1 - eps and y1 > b0 + eps):
+                if z0 < c1 - eps and z1 > c0 + eps:
+                    collisions.append((min(i, j), max(i, j)))
+                    continue
+                area = (min(x1, a1) - max(x0, a0)) * (min(y1, b1) - max(y0, b0))
+                if abs(z0 - c1) < eps: supports[i].append((j, area))
+                elif abs(c0 - z1) < eps: supports[j].append((i, area))
+        active.append(i)
+    
+    # Support depth, loads and rules, bottom boxes first
+    layers = [1] * n
+    loads = [0.0] * n
+    unsupported, stacking_violations = [], []
+    for i in sorted(range(n), key=lambda k: boxes[k][2]):
+        if boxes[i][2] <= eps: continue
+        item = items[i]
+        below = supports[i]
+        total_area = sum(area for _, area in below)
+        if total_area < item.base_area * 0.95:
+            unsupported.append(i)
+        if below:
+            layers[i] = 1 + max(layers[j] for j, _ in below)
+        for j, area in below:
+            loads[j] += item.weight * area / total_area
+            if not container._pair_rules(items[j], item, layers[j]):
+                stacking_violations.append((j, i))
+    overloaded = [i for i in range(n) if loads[i] > items[i].max_load_on_top + 1e-6]
+    
+    status = ['ok'] * n
+    for key, flagged in (('overloaded', overloaded), ('stacking', [above for _, above in stacking_violations]),
+                         ('unsupported', unsupported), ('collision', [i for pair in collisions for i in pair]),
+                         ('out_of_bounds', out_of_bounds)):
+        for i in flagged: status[i] = key
+    
+    total_weight = sum(item.weight for item in items)
+    return {
+        "collisions": sorted(collisions),
+        "out_of_bounds": out_of_bounds,
+        "unsupported": sorted(unsupported),
+        "stacking_violations": stacking_violations,
+        "overloaded": overloaded,
+        "overweight": total_weight > container.max_weight,
+        "supports": supports,
+        "layers": layers,
+        "loads": loads,
+        "status": status,
+    }
+
+# Mesh3d triangles of a box given its 8 corners in _box_corners order
+BOX_I = [0, 0, 4, 4, 0, 0, 1, 1, 2, 2, 3, 3]
+BOX_J = [1, 2, 5, 6, 1, 5, 2, 6, 3, 7, 0, 4]
+BOX_K = [2, 3, 6, 7, 5, 4, 6, 5, 7, 6, 4, 7]
+
+def _box_corners(x, y, z, l, w, h):
+    vx = [x, x+l, x+l, x, x, x+l, x+l, x]
+    vy = [y, y, y+w, y+w, y, y, y+w, y+w]
+    vz = [z, z, z, z, z+h, z+h, z+h, z+h]
+    return vx, vy, vz
+
+def _box_edges(x, y, z, l, w, h):
+    return [
+        ([x, x+l], [y, y], [z, z]), ([x, x+l], [y+w, y+w], [z, z]), 
+        ([x, x+l], [y, y], [z+h, z+h]), ([x, x+l], [y+w, y+w], [z+h, z+h]),
+        ([x, x], [y, y+w], [z, z]), ([x+l, x+l], [y, y+w], [z, z]),
+        ([x, x], [y, y+w], [z+h, z+h]), ([x+l, x+l], [y, y+w], [z+h, z+h]),
+        ([x, x], [y, y], [z, z+h]), ([x+l, x+l], [y, y], [z, z+h]),
+        ([x, x], [y+w, y+w], [z, z+h]), ([x+l, x+l], [y+w, y+w], [z, z+h])
     ]
-    for lx, ly, lz in cage_lines:
-        fig.add_trace(go.Scatter3d(x=lx, y=ly, z=lz, mode='lines', line=dict(color='white', width=4), showlegend=False, hoverinfo='skip'))
 
-    # 2. Add Packed Items (With Collision Detection for Manual Adjustments)
+def _box_edge_path(x, y, z, l, w, h):
+    """The 12 edges of a box as one polyline: bottom loop, up, top loop, then the 3 other uprights."""
+    X, Y, Z = x + l, y + w, z + h
+    xs = [x, X, X, x, x, x, X, X, x, x, None, X, X, None, X, X, None, x, x, None]
+    ys = [y, y, Y, Y, y, y, y, Y, Y, y, None, y, y, None, Y, Y, None, Y, Y, None]
+    zs = [z, z, z, z, z, Z, Z, Z, Z, Z, None, z, Z, None, z, Z, None, z, Z, None]
+    return xs, ys, zs
+
+def _render_boxes(container, highlight_name, status=None):
+    """
+    Per-box render records: (group key, mesh name, customdata, hover text, edge style, geometry).
+    Group key = (mesh colour, opacity); edge style = (colour, width, dash), or None for no edges.
+    status: validate_plan(container)['status'] if the caller already has it.
+    """
+    boxes = []
+    
+    # Packed Items (With Collision Detection for Manual Adjustments)
+    if status is None: status = validate_plan(container)['status']
     for i, item in enumerate(container.items):
         x, y, z = item.x, item.y, item.z
         l, w, h = item.get_dimension()
         
-        # --- NEW: COLLISION / OUT-OF-BOUNDS CHECK ---
-        is_overlapping = False
-        
-        # Check 1: Out of Container Bounds
-        if (x < -EPSILON or y < -EPSILON or z < -EPSILON or 
-            x + l > L + EPSILON or y + w > W + EPSILON or z + h > H + EPSILON):
-            is_overlapping = True
-            
-        # Check 2: Colliding with other Packed Items
-        if not is_overlapping:
-            for j, other in enumerate(container.items):
-                if i == j: continue # Don't check against itself
-                o_x, o_y, o_z = other.x, other.y, other.z
-                o_l, o_w, o_h = other.get_dimension()
-                
-                # Standard AABB overlap check
-                if (x < o_x + o_l - EPSILON and x + l > o_x + EPSILON and
-                    y < o_y + o_w - EPSILON and y + w > o_y + EPSILON and
-                    z < o_z + o_h - EPSILON and z + h > o_z + EPSILON):
-                    is_overlapping = True
-                    break
-        
-        # Decide Render Properties based on overlap status
+        # Decide Render Properties based on plan status
         render_color = item.color
         edge_color = 'black'
-        hover_status = "✅ Inside"
+        hover_status = PLAN_STATUS_TEXT[status[i]]
         
-        if is_overlapping:
+        if status[i] in ('collision', 'out_of_bounds'):
             render_color = 'rgba(239, 68, 68, 0.8)' # Bright Red for Overlap
             edge_color = 'red'
-            hover_status = "❌ COLLISION DETECTED"
-        
-        vx = [x, x+l, x+l, x, x, x+l, x+l, x]
-        vy = [y, y, y+w, y+w, y, y, y+w, y+w]
-        vz = [z, z, z, z, z+h, z+h, z+h, z+h]
-        
-        i_idx = [0, 0, 4, 4, 0, 0, 1, 1, 2, 2, 3, 3]
-        j_idx = [1, 2, 5, 6, 1, 5, 2, 6, 3, 7, 0, 4]
-        k_idx = [2, 3, 6, 7, 5, 4, 6, 5, 7, 6, 4, 7]
+        elif status[i] != 'ok':
+            edge_color = 'orange' # Rests, but breaks a support/stacking/load rule
         
         type_str = "Pallet" if item.packaging_type == 1 else "Crate"
         
@@ -800,77 +2105,214 @@ def visualize_container(container, highlight_name=None):
         opacity = 1.0
         if highlight_name and highlight_name != item.name:
             opacity = 0.2
-            
-        fig.add_trace(go.Mesh3d(
-            x=vx, y=vy, z=vz,
-            i=i_idx, j=j_idx, k=k_idx,
-            color=render_color,
-            opacity=opacity,
-            flatshading=True,
-            name=item.name,
-            customdata=[f"P_{i}"] * len(vx),
-            text=f"{hover_status}<br>Priority: {item.priority}<br>{item.name}<br>Type: {type_str}<br>Pos: {x:.0f},{y:.0f},{z:.0f}"
-        ))
-        
-        edges = [
-            ([x, x+l], [y, y], [z, z]), ([x, x+l], [y+w, y+w], [z, z]), 
-            ([x, x+l], [y, y], [z+h, z+h]), ([x, x+l], [y+w, y+w], [z+h, z+h]),
-            ([x, x], [y, y+w], [z, z]), ([x+l, x+l], [y, y+w], [z, z]),
-            ([x, x], [y, y+w], [z+h, z+h]), ([x+l, x+l], [y, y+w], [z+h, z+h]),
-            ([x, x], [y, y], [z, z+h]), ([x+l, x+l], [y, y], [z, z+h]),
-            ([x, x], [y+w, y+w], [z, z+h]), ([x+l, x+l], [y+w, y+w], [z, z+h])
-        ]
-        for ex, ey, ez in edges:
-            fig.add_trace(go.Scatter3d(x=ex, y=ey, z=ez, mode='lines', line=dict(color=edge_color, width=2), showlegend=False, hoverinfo='skip'))
-
-    # 3. Add Unpacked Items (Ghost items now dynamically follow their x,y,z and appear red)
+        
+        text = f"{hover_status}<br>Priority: {item.priority}<br>{item.name}<br>Type: {type_str}<br>Pos: {x:.0f},{y:.0f},{z:.0f}"
+        boxes.append(((render_color, opacity), item.name, f"P_{i}", text, (edge_color, 2, None), (x, y, z, l, w, h)))
+
+    # Unpacked Items (Ghost items dynamically follow their x,y,z and appear red)
     for i, item in enumerate(container.unpacked_items):
         l, w, h = item.get_dimension()
-        x = getattr(item, 'x', 0)
-        y = getattr(item, 'y', 0)
-        z = getattr(item, 'z', 0)
-        
-        vx = [x, x+l, x+l, x, x, x+l, x+l, x]
-        vy = [y, y, y+w, y+w, y, y, y+w, y+w]
-        vz = [z, z, z, z, z+h, z+h, z+h, z+h]
-        
-        i_idx = [0, 0, 4, 4, 0, 0, 1, 1, 2, 2, 3, 3]
-        j_idx = [1, 2, 5, 6, 1, 5, 2, 6, 3, 7, 0, 4]
-        k_idx = [2, 3, 6, 7, 5, 4, 6, 5, 7, 6, 4, 7]
+        x, y, z = item.x, item.y, item.z
         
         # Ghostly Red effect for overlapped/unpacked items
         opacity = 0.8 if highlight_name == item.name else 0.4
-            
-        fig.add_trace(go.Mesh3d(
-            x=vx, y=vy, z=vz,
-            i=i_idx, j=j_idx, k=k_idx,
-            color='rgba(239, 68, 68, 0.5)', 
-            opacity=opacity,
-            flatshading=True,
-            name=f"UNPACKED_{i}",
-            customdata=[f"U_{i}"] * len(vx),
-            text=f"⚠️ UNPACKED/OVERLAP<br>{item.name}<br>Dim: {l:.0f}x{w:.0f}x{h:.0f}"
-        ))
-        
-        edges = [
-            ([x, x+l], [y, y], [z, z]), ([x, x+l], [y+w, y+w], [z, z]), 
-            ([x, x+l], [y, y], [z+h, z+h]), ([x, x+l], [y+w, y+w], [z+h, z+h]),
-            ([x, x], [y, y+w], [z, z]), ([x+l, x+l], [y, y+w], [z, z]),
-            ([x, x], [y, y+w], [z+h, z+h]), ([x+l, x+l], [y, y+w], [z+h, z+h]),
-            ([x, x], [y, y], [z, z+h]), ([x+l, x+l], [y, y], [z, z+h]),
-            ([x, x], [y+w, y+w], [z, z+h]), ([x+l, x+l], [y+w, y+w], [z, z+h])
-        ]
-        for ex, ey, ez in edges:
-            fig.add_trace(go.Scatter3d(x=ex, y=ey, z=ez, mode='lines', line=dict(color='red', width=3, dash='dash'), showlegend=False, hoverinfo='skip'))
+        
+        text = f"⚠️ UNPACKED/OVERLAP<br>{item.name}<br>Dim: {l:.0f}x{w:.0f}x{h:.0f}"
+        boxes.append((('rgba(239, 68, 68, 0.5)', opacity), f"UNPACKED_{i}", f"U_{i}", text, ('red', 3, 'dash'), (x, y, z, l, w, h)))
+    return boxes
 
-    # 4. CoG Marker
+# Level of detail: 'auto' switches it on above LOD_MIN_BOXES boxes, and merged
+# blocks only get edge lines while the drawn box count stays under LOD_EDGE_LIMIT
+LOD_MIN_BOXES = 400
+LOD_EDGE_LIMIT = 300
+
+def _merge_runs(records, axis):
+    """Merges records of equal group/type whose boxes continue each other along axis (0=x, 1=y, 2=z)."""
+    others = [a for a in range(3) if a != axis]
+    def side_key(rec):
+        geom = rec['geom']
+        return (rec['key'],) + tuple(geom[a] for a in others) + tuple(geom[3 + a] for a in others)
+    
+    records = sorted(records, key=lambda rec: (side_key(rec), rec['geom'][axis]))
+    merged = []
+    for rec in records:
+        prev = merged[-1] if merged else None
+        if (prev is not None and side_key(prev) == side_key(rec) and
+            abs(prev['geom'][axis] + prev['geom'][3 + axis] - rec['geom'][axis]) < EPSILON):
+            geom = list(prev['geom'])
+            geom[3 + axis] += rec['geom'][3 + axis]
+            prev['geom'] = tuple(geom)
+            prev['count'] += rec['count']
+        else:
+            merged.append(dict(rec))
+    return merged
+
+def _lod_boxes(container, boxes, highlight_name):
+    """
+    Level-of-detail version of the render records: the highlighted items, the boxes
+    touching them and colliding boxes stay as they are; every other packed box is
+    merged into same-type columns and then into contiguous blocks along x and y, and
+    unpacked ghosts of one type sitting on the same spot are drawn once.
+    A merged block keeps the customdata of its first box, so a click still selects an item.
+    """
+    detail = set()
+    position = {id(item): i for i, item in enumerate(container.items)} if highlight_name else {}
+    for i, item in enumerate(container.items):
+        if highlight_name and item.name == highlight_name:
+            detail.add(i)
+            l, w, h = item.get_dimension()
+            for other in container.grid.query(item.x - EPSILON, item.y - EPSILON, l + 2 * EPSILON, w + 2 * EPSILON):
+                o_h = other.get_dimension()[2]
+                if other.z <= item.z + h + EPSILON and other.z + o_h >= item.z - EPSILON:
+                    detail.add(position[id(other)])
+    
+    kept, records, ghosts = [], [], {}
+    for box in boxes:
+        group, name, ref, text, edge_style, geom = box
+        idx = int(ref[2:]) if ref.startswith("P_") else None
+        if idx is None:
+            # Unpacked ghosts parked on the same spot are drawn once
+            item = container.unpacked_items[int(ref[2:])]
+            if highlight_name == item.name: kept.append(box)
+            else: ghosts.setdefault((group, edge_style, item.type_id, geom), box)
+            continue
+        if idx in detail or edge_style[0] != 'black':
+            kept.append(box)
+            continue
+        item = container.items[idx]
+        key = (group, edge_style, item.type_id, name)
+        records.append(dict(key=key, ref=ref, text=text, geom=geom, count=1))
+    
+    for axis in (2, 0, 1):
+        records = _merge_runs(records, axis)
+    
+    merged_boxes = []
+    for rec in records:
+        group, edge_style, _, name = rec['key']
+        x, y, z, l, w, h = rec['geom']
+        if rec['count'] == 1:
+            text = rec['text']
+        else:
+            text = f"✅ Inside<br>{name} x{rec['count']} (merged block)<br>Pos: {x:.0f},{y:.0f},{z:.0f}<br>Size: {l:.0f}x{w:.0f}x{h:.0f}"
+        merged_boxes.append((group, name, rec['ref'], text, edge_style, rec['geom']))
+    
+    merged_boxes += ghosts.values()
+    
+    # Past the limit only the full-detail boxes keep their edge lines
+    if len(kept) + len(merged_boxes) > LOD_EDGE_LIMIT:
+        merged_boxes = [box[:4] + (None,) + box[5:] for box in merged_boxes]
+    return kept + merged_boxes
+
+def _batched_arrays(boxes):
+    """
+    Grouped trace arrays for the batched figure: ({group: mesh arrays},
+    {edge style: (xs, ys, zs)}, {ref: [group, vertex offset, edge style, edge offset]}).
+    """
+    meshes, edges, slots = {}, {}, {}
+    for group, name, ref, text, edge_style, geom in boxes:
+        mesh = meshes.setdefault(group, dict(x=[], y=[], z=[], i=[], j=[], k=[], customdata=[], text=[]))
+        base = len(mesh['x'])
+        vx, vy, vz = _box_corners(*geom)
+        mesh['x'] += vx
+        mesh['y'] += vy
+        mesh['z'] += vz
+        mesh['i'] += [base + v for v in BOX_I]
+        mesh['j'] += [base + v for v in BOX_J]
+        mesh['k'] += [base + v for v in BOX_K]
+        mesh['customdata'] += [ref] * 8
+        mesh['text'] += [text] * 8
+        slot = [group, base, edge_style, None]
+        
+        if edge_style is not None:
+            path = edges.setdefault(edge_style, ([], [], []))
+            slot[3] = len(path[0])
+            for coords, part in zip(path, _box_edge_path(*geom)):
+                coords += part
+        slots[ref] = slot
+    return meshes, edges, slots
+
+def _mesh_trace(group, mesh):
+    color, opacity = group
+    return go.Mesh3d(color=color, opacity=opacity, flatshading=True, hoverinfo='text', showlegend=False, **mesh)
+
+def _edge_trace(edge_style, path):
+    edge_color, edge_width, dash = edge_style
+    line = dict(color=edge_color, width=edge_width)
+    if dash: line['dash'] = dash
+    ex, ey, ez = path
+    return go.Scatter3d(x=ex, y=ey, z=ez, mode='lines', line=line, showlegend=False, hoverinfo='skip')
+
+def _cog_trace(container):
     stats = get_container_stats(container)
-    cog_x, cog_y, cog_z = stats['cog_x'], stats['cog_y'], stats['cog_z']
-    fig.add_trace(go.Scatter3d(
-        x=[cog_x], y=[cog_y], z=[cog_z],
+    return go.Scatter3d(
+        x=[stats['cog_x']], y=[stats['cog_y']], z=[stats['cog_z']],
         mode='markers', marker=dict(size=12, color='red', symbol='circle'),
         name='Center of Gravity'
-    ))
+    )
+
+def visualize_container(container, highlight_name=None, batched=True, lod='auto', status=None):
+    """
+    3D plotly figure of the plan. batched=True draws one Mesh3d per colour/opacity
+    group and one edge trace per line style (a few traces instead of ~13 per box);
+    batched=False draws every box as its own traces. Both keep the per-vertex
+    P_i / U_i customdata and hover text used for click selection.
+    lod=True merges same-type columns/blocks and drops their edges for very large
+    plans (see _lod_boxes); 'auto' turns it on above LOD_MIN_BOXES boxes.
+    status: validate_plan(container)['status'] if the caller already has it.
+    """
+    fig = go.Figure()
+    L, W, H = container.L, container.W, container.H
+    
+    # 1. Container Wireframe
+    cage_lines = [
+        ([0, L], [0, 0], [0, 0]), ([0, L], [W, W], [0, 0]), ([0, L], [0, 0], [H, H]), ([0, L], [W, W], [H, H]),
+        ([0, 0], [0, W], [0, 0]), ([L, L], [0, W], [0, 0]), ([0, 0], [0, W], [H, H]), ([L, L], [0, W], [H, H]),
+        ([0, 0], [0, 0], [0, H]), ([L, L], [0, 0], [0, H]), ([0, 0], [W, W], [0, H]), ([L, L], [W, W], [0, H])
+    ]
+    if batched:
+        cx, cy, cz = _box_edge_path(0, 0, 0, L, W, H)
+        fig.add_trace(go.Scatter3d(x=cx, y=cy, z=cz, mode='lines', line=dict(color='white', width=4), showlegend=False, hoverinfo='skip'))
+    else:
+        for lx, ly, lz in cage_lines:
+            fig.add_trace(go.Scatter3d(x=lx, y=ly, z=lz, mode='lines', line=dict(color='white', width=4), showlegend=False, hoverinfo='skip'))
+
+    boxes = _render_boxes(container, highlight_name, status)
+    if lod == 'auto':
+        lod = len(boxes) > LOD_MIN_BOXES
+    if lod:
+        container._sync_index()
+        boxes = _lod_boxes(container, boxes, highlight_name)
+    
+    if not batched:
+        # 2./3. One mesh + 12 edge traces per box
+        for (color, opacity), name, ref, text, edge_style, geom in boxes:
+            vx, vy, vz = _box_corners(*geom)
+            fig.add_trace(go.Mesh3d(
+                x=vx, y=vy, z=vz,
+                i=BOX_I, j=BOX_J, k=BOX_K,
+                color=color,
+                opacity=opacity,
+                flatshading=True,
+                name=name,
+                customdata=[ref] * len(vx),
+                text=text
+            ))
+            if edge_style is None: continue
+            edge_color, edge_width, dash = edge_style
+            line = dict(color=edge_color, width=edge_width)
+            if dash: line['dash'] = dash
+            for ex, ey, ez in _box_edges(*geom):
+                fig.add_trace(go.Scatter3d(x=ex, y=ey, z=ez, mode='lines', line=line, showlegend=False, hoverinfo='skip'))
+    else:
+        # 2./3. Batched: boxes of a group share one mesh, offset by 8 vertices each
+        meshes, edges, _ = _batched_arrays(boxes)
+        for group, mesh in meshes.items():
+            fig.add_trace(_mesh_trace(group, mesh))
+        for edge_style, path in edges.items():
+            fig.add_trace(_edge_trace(edge_style, path))
+
+    # 4. CoG Marker
+    fig.add_trace(_cog_trace(container))
 
     fig.update_layout(
         scene=dict(
@@ -883,3 +2325,127 @@ def visualize_container(container, highlight_name=None):
         margin=dict(l=0, r=0, b=0, t=0)
     )
     return fig
+
+class FigureCache:
+    """
+    Keeps the batched plan figure between UI reruns. The figure is keyed by the
+    container and its revision (the plan version: every placement, move or unpack
+    bumps it); when only a few boxes changed, figure() patches their vertices and
+    edge points in place instead of rebuilding the figure. Boxes that change colour
+    group (e.g. a move that starts or ends a collision) are collapsed in their old mesh
+    and appended to the new one. LOD figures are always rebuilt.
+    """
+    def __init__(self):
+        self.fig = None
+        # The container itself, not its id(): a freed plan's id can be reused by a new
+        # one that starts at the same revision
+        self.container = None
+        self.key = None
+        self.highlight_name = None
+        self.boxes = None
+        self.lod = False
+        self.patched = 0 # boxes patched by the last figure() call (-1 = full rebuild)
+
+    def figure(self, container, highlight_name=None, status=None):
+        """Plan figure; status: validate_plan(container)['status'] if the caller already has it."""
+        key = (container.revision, highlight_name)
+        if self.fig is not None and container is self.container and key == self.key:
+            self.patched = 0
+            return self.fig
+        
+        if status is None: status = validate_plan(container)['status']
+        boxes = _render_boxes(container, highlight_name, status)
+        lod = len(boxes) > LOD_MIN_BOXES
+        if (self.fig is None or lod or self.lod or container is not self.container or highlight_name != self.highlight_name or
+            len(boxes) != len(self.boxes) or any(new[2] != old[2] for new, old in zip(boxes, self.boxes))):
+            self._rebuild(container, highlight_name, boxes, lod, status)
+        else:
+            self._patch(container, boxes)
+        self.container = container
+        self.key = key
+        return self.fig
+
+    def _rebuild(self, container, highlight_name, boxes, lod, status):
+        self.fig = visualize_container(container, highlight_name=highlight_name, lod=lod, status=status)
+        self.highlight_name = highlight_name
+        self.boxes = boxes
+        self.patched = -1
+        # Merged LOD blocks don't map to single boxes: nothing to patch into later
+        self.lod = lod
+        if lod: return
+        self.meshes, self.edges, self.slots = _batched_arrays(boxes)
+        # Trace order as laid out by visualize_container: cage, meshes, edges, CoG
+        self.mesh_traces = {group: 1 + n for n, group in enumerate(self.meshes)}
+        self.edge_traces = {style: 1 + len(self.meshes) + n for n, style in enumerate(self.edges)}
+        self.cog_trace = len(self.fig.data) - 1
+
+    def _patch(self, container, boxes):
+        dirty_meshes, dirty_edges = {}, set() # group -> mesh fields to resend
+        changed = [(new, old) for new, old in zip(boxes, self.boxes) if new != old]
+        for (group, name, ref, text, edge_style, geom), _ in changed:
+            slot = self.slots[ref]
+            old_group, base, old_style, offset = slot
+            vx, vy, vz = _box_corners(*geom)
+            
+            if group != old_group:
+                # Collapse the box in its old mesh (degenerate triangles draw nothing)
+                mesh = self.meshes[old_group]
+                for axis in ('x', 'y', 'z'):
+                    mesh[axis][base:base + 8] = [mesh[axis][base]] * 8
+                dirty_meshes.setdefault(old_group, set()).update(('x', 'y', 'z'))
+                if group not in self.meshes:
+                    self.meshes[group] = dict(x=[], y=[], z=[], i=[], j=[], k=[], customdata=[], text=[])
+                    self.fig.add_trace(_mesh_trace(group, self.meshes[group]))
+                    self.mesh_traces[group] = len(self.fig.data) - 1
+                mesh = self.meshes[group]
+                base = len(mesh['x'])
+                for axis, values in zip(('x', 'y', 'z'), (vx, vy, vz)):
+                    mesh[axis] += values
+                mesh['i'] += [base + v for v in BOX_I]
+                mesh['j'] += [base + v for v in BOX_J]
+                mesh['k'] += [base + v for v in BOX_K]
+                mesh['customdata'] += [ref] * 8
+                mesh['text'] += [text] * 8
+                dirty_meshes.setdefault(group, set()).update(mesh)
+            else:
+                # Same mesh: only the vertices and hover text move
+                mesh = self.meshes[group]
+                for axis, values in zip(('x', 'y', 'z'), (vx, vy, vz)):
+                    mesh[axis][base:base + 8] = values
+                mesh['text'][base:base + 8] = [text] * 8
+                dirty_meshes.setdefault(group, set()).update(('x', 'y', 'z', 'text'))
+            
+            if edge_style != old_style:
+                if old_style is not None:
+                    path = self.edges[old_style]
+                    for coords in path:
+                        coords[offset:offset + 20] = [None] * 20
+                    dirty_edges.add(old_style)
+                offset = None
+                if edge_style is not None:
+                    if edge_style not in self.edges:
+                        self.edges[edge_style] = ([], [], [])
+                        self.fig.add_trace(_edge_trace(edge_style, self.edges[edge_style]))
+                        self.edge_traces[edge_style] = len(self.fig.data) - 1
+                    path = self.edges[edge_style]
+                    offset = len(path[0])
+                    for coords, part in zip(path, _box_edge_path(*geom)):
+                        coords += part
+            elif edge_style is not None:
+                path = self.edges[edge_style]
+                for coords, part in zip(path, _box_edge_path(*geom)):
+                    coords[offset:offset + 20] = part
+            if edge_style is not None: dirty_edges.add(edge_style)
+            self.slots[ref] = [group, base, edge_style, offset]
+        
+        with self.fig.batch_update():
+            for group, fields in dirty_meshes.items():
+                mesh = self.meshes[group]
+                self.fig.data[self.mesh_traces[group]].update({name: mesh[name] for name in fields})
+            for style in dirty_edges:
+                ex, ey, ez = self.edges[style]
+                self.fig.data[self.edge_traces[style]].update(x=ex, y=ey, z=ez)
+            cog = _cog_trace(container)
+            self.fig.data[self.cog_trace].update(x=cog.x, y=cog.y, z=cog.z)
+        self.boxes = boxes
+        self.patched = len(changed)